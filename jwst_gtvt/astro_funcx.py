@@ -4,6 +4,7 @@
 #   Got rid of degrees trig functions
 
 from math import *
+import numpy as np
 
 D2R = pi/180.
 R2D = 180./pi
@@ -21,6 +22,14 @@ def pa(tgt_c1,tgt_c2,obj_c1,obj_c2):
     if p >= PI2: p -= PI2
     return p
 
+def pa_many(tgt_c1,tgt_c2,obj_c1,obj_c2):
+    """pa() for numpy arrays, broadcasting the coordinates against each other."""
+    y = np.cos(obj_c2)*np.sin(obj_c1-tgt_c1)
+    x = (np.sin(obj_c2)*np.cos(tgt_c2)-np.cos(obj_c2)*np.sin(tgt_c2)*np.cos(obj_c1-tgt_c1))
+    p = np.arctan2(y,x)
+    p = np.where(p < 0., p + PI2, p)
+    return np.where(p >= PI2, p - PI2, p)
+
 def delta_pa_no_roll(pos1_c1,pos1_c2,pos2_c1,pos2_c2):
     """Calculates the change in position angle between two positions with no roll about V1"""
     u = (sin(pos1_c2) + sin(pos2_c2)) * sin(pos2_c1 - pos1_c1)
@@ -31,4 +40,8 @@ def dist(obj1_c1,obj1_c2,obj2_c1,obj2_c2):
     """angular distance betrween two objects, positions specified in spherical coordinates."""
     x = cos(obj2_c2)*cos(obj1_c2)*cos(obj2_c1-obj1_c1) + sin(obj2_c2)*sin(obj1_c2)
     return acos(unit_limit(x))
-    
+
+def dist_many(obj1_c1,obj1_c2,obj2_c1,obj2_c2):
+    """dist() for numpy arrays, broadcasting the coordinates against each other."""
+    x = np.cos(obj2_c2)*np.cos(obj1_c2)*np.cos(obj2_c1-obj1_c1) + np.sin(obj2_c2)*np.sin(obj1_c2)
+    return np.arccos(np.clip(x, -1., 1.))
@@ -2,10 +2,18 @@
 #Module ephemeris.py
 from __future__ import print_function
 
+import collections
+import json
+import hashlib
+import itertools
+import os
 import sys
+import tempfile
+import threading
 #import time
 #import time_extensionsx as time2
 from math import *
+import numpy as np
 from .rotationsx import *
 from . import astro_funcx as astro_func
 
@@ -20,70 +28,482 @@ SUN_ANGLE_PAD = 0.5 * D2R   #pad away from Sun angle limits when constructing sa
 obliquity_of_the_ecliptic = -23.439291  # At J2000 equinox
 obliquity_of_the_ecliptic *=  D2R
 Qecl2eci = QX(obliquity_of_the_ecliptic)
+# Matrix form of Qecl2eci.inv_cnvrt, rotating (N,3) equatorial vectors into the ecliptic frame
+Meci2ecl = np.array([[1., 0., 0.],
+                     [0., cos(obliquity_of_the_ecliptic), -sin(obliquity_of_the_ecliptic)],
+                     [0., sin(obliquity_of_the_ecliptic), cos(obliquity_of_the_ecliptic)]])
 
+EPHEMERIS_CACHE_VERSION = 3  # bump whenever the layout of compiled ephemerides changes
+DEFAULT_EPHEMERIS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "horizons_EM_jwst_wrt_sun_2020-2024.txt")
+
+INTERPOLATION_MODES = ('linear', 'hermite', 'chebyshev')
+CHECKSUM_BLOCK = 1 << 20  # bytes read at a time when hashing a text ephemeris
+SUN_TABLE_CACHE_BYTES = 64 << 20  # bytes of Sun tables kept per Ephemeris, beyond the most recent one
+BISECT_TOLERANCE = 0.000001  # days, default accuracy of the window edges
+LONGITUDE_MAP_STEP = 0.25  # days between the samples of a SunLongitudeMap
+LONGITUDE_MAP_MARGIN = 0.25 * D2R  # latitude margin, on top of the Sun's own, around tangent targets
+LONGITUDE_MAP_PAD = 5. * D2R  # longitude padding of the interval when collecting first guesses
+SUN_RATE_MARGIN = 1.05  # safety factor on the Sun's angular rate measured between grid dates
+SUN_RATE_STEP = 0.25  # days between the dates on which max_sun_rate measures the Sun's motion
+ADAPTIVE_MIN_STEP = 1.  # days, shortest step of step_FOR_many before steps near a limit are subdivided
+ADAPTIVE_GRAZE_STEP = 0.01  # days, finest subdivision of steps in which step_FOR_many could miss a limit
+ADAPTIVE_MAX_STEP = 28.  # days, coarsest step of step_FOR_many
+
+_ephemeris_registry = {}  # (absolute path(s), cnvrt, interp) -> shared Ephemeris
+_ephemeris_registry_lock = threading.Lock()
+_horizons_index_cache = {}  # (absolute path, mtime, size) -> HorizonsIndex
+_horizons_index_lock = threading.Lock()
+_checksum_cache = {}  # (absolute path, mtime, size) -> SHA-1 of the file
+_checksum_lock = threading.Lock()
+_sun_table_lock = threading.Lock()
+
+
+
+class EphemerisRangeError(ValueError):
+    """Raised for dates outside of the span covered by an ephemeris."""
+    pass
+
+def ephemeris_cache_dir():
+    """Directory holding compiled (binary) copies of the text ephemerides."""
+    from astropy.config import get_cache_dir
+    return os.path.join(get_cache_dir(), 'jwst_gtvt')
+
+def compiled_ephemeris_path(afile, cnvrt=False, cache_dir=None):
+    """Path of the compiled ephemeris for afile.
+
+    The name carries the cache format version and a checksum of the source
+    text, so editing the text file or changing the format never picks up a
+    stale copy."""
+    checksum = _file_checksum(afile)
+    if cache_dir is None:
+        cache_dir = ephemeris_cache_dir()
+    name = '{}.{}.{}.v{}.npy'.format(os.path.basename(afile), 'ecl' if cnvrt else 'eq',
+                                     checksum, EPHEMERIS_CACHE_VERSION)
+    return os.path.join(cache_dir, name)
+
+def _may_have_compiled_copy(afile, cnvrt=False, cache_dir=None):
+    """Whether the cache holds a compiled ephemeris named after afile, of any checksum.
+
+    Lets ranged loads skip hashing the whole text file when it was never compiled."""
+    if cache_dir is None:
+        cache_dir = ephemeris_cache_dir()
+    prefix = '{}.{}.'.format(os.path.basename(afile), 'ecl' if cnvrt else 'eq')
+    suffix = '.v{}.npy'.format(EPHEMERIS_CACHE_VERSION)
+    try:
+        return any(name.startswith(prefix) and name.endswith(suffix) for name in os.listdir(cache_dir))
+    except OSError:
+        return False
+
+def _file_checksum(afile):
+    """SHA-1 of afile, hashed only if the file is new or has changed."""
+    path = os.path.abspath(afile)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    with _checksum_lock:
+        checksum = _checksum_cache.get(key)
+    if checksum is None:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as fin:
+            for block in iter(lambda: fin.read(CHECKSUM_BLOCK), b''):
+                sha1.update(block)
+        checksum = sha1.hexdigest()
+        with _checksum_lock:
+            _checksum_cache[key] = checksum
+    return checksum
+
+def compile_ephemeris(afile, cnvrt=False, cache_dir=None, verbose=False):
+    """Parses a text ephemeris once and saves the samples as a binary .npy file.
+
+    Returns the path of the compiled file."""
+    path = compiled_ephemeris_path(afile, cnvrt, cache_dir)
+    samples = Ephemeris._read_text(afile, cnvrt, verbose)
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    # Write to a temporary file first so concurrent readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fout:
+            np.save(fout, samples)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+def get_ephemeris(afile=None, cnvrt=False, verbose=False, interp='linear'):
+    """Returns the process-wide Ephemeris for (afile, cnvrt, interp), loading it on first use.
+
+    The returned object is shared between callers and threads; its sample
+    arrays are read-only.  afile defaults to DEFAULT_EPHEMERIS and may be a
+    list of files to stitch together."""
+    key = (_absolute_paths(afile if afile is not None else DEFAULT_EPHEMERIS), bool(cnvrt), interp)
+    with _ephemeris_registry_lock:
+        eph = _ephemeris_registry.get(key)
+        if eph is None:
+            eph = Ephemeris(key[0], key[1], verbose=False, interp=interp)
+            _ephemeris_registry[key] = eph
+    if verbose:
+        print("Using Ecliptic Coordinates" if cnvrt else "Using Equatorial Coordinates")
+    return eph
+
+def _absolute_paths(afile):
+    """Absolute path of afile, or a tuple of them for a list of files."""
+    if isinstance(afile, (list, tuple)):
+        return tuple(os.path.abspath(f) for f in afile)
+    return os.path.abspath(afile)
+
+def preload_ephemeris(afile=None, cnvrt=False, interp='linear'):
+    """Loads the shared Ephemeris ahead of time, e.g. at import or as a worker initializer."""
+    return get_ephemeris(afile, cnvrt, interp=interp)
+
+def invalidate_ephemeris(afile=None, cnvrt=None):
+    """Drops shared ephemerides so the next get_ephemeris() reloads them.
+
+    With no arguments every entry is dropped, otherwise only those matching
+    afile and/or cnvrt."""
+    path = _absolute_paths(afile) if afile is not None else None
+    with _ephemeris_registry_lock:
+        for key in list(_ephemeris_registry):
+            if (path is None or key[0] == path) and (cnvrt is None or key[1] == bool(cnvrt)):
+                del _ephemeris_registry[key]
+
+def publish_ephemeris(directory, afile=None, cnvrt=False, interp='linear'):
+    """Writes the shared Ephemeris and its cached Sun tables to directory as .npy files.
+
+    Processes calling attach_ephemeris(directory) then memory map these
+    arrays instead of loading the ephemeris themselves, so pool workers
+    start quickly and share one copy of the data through the page cache.
+    Compute the Sun tables the workers need (Ephemeris.sun_table) first."""
+    eph = get_ephemeris(afile, cnvrt, interp=interp)
+    paths = _absolute_paths(afile if afile is not None else DEFAULT_EPHEMERIS)
+    if eph.samples is not None:
+        np.save(os.path.join(directory, 'samples.npy'), np.asarray(eph.samples))
+    if eph.chebyshev is not None:
+        eph.chebyshev.save(os.path.join(directory, 'chebyshev.npy'))
+    tables = [table for (key, table) in eph._sun_tables]
+    for (indx, table) in enumerate(tables):
+        table.save(os.path.join(directory, 'sun_table_{}.npy'.format(indx)))
+    with open(os.path.join(directory, 'ephemeris.json'), 'w') as fout:
+        json.dump({'afile': paths, 'cnvrt': bool(cnvrt), 'interp': interp, 'sun_tables': len(tables)}, fout)
+    return directory
+
+def attach_ephemeris(directory):
+    """Registers the ephemeris written by publish_ephemeris() as this process's shared one.
+
+    The arrays are memory mapped read-only, not copied, and the next
+    get_ephemeris() for the same file returns this Ephemeris with its Sun
+    tables already in place.  Meant as a process pool initializer."""
+    with open(os.path.join(directory, 'ephemeris.json')) as fin:
+        meta = json.load(fin)
+    path = os.path.join(directory, 'chebyshev.npy')
+    if os.path.exists(os.path.join(directory, 'samples.npy')):
+        eph = Ephemeris.__new__(Ephemeris)
+        eph.interp = meta['interp']
+        eph._set_samples(np.load(os.path.join(directory, 'samples.npy'), mmap_mode='r'))
+        if os.path.exists(path):
+            eph.chebyshev = ChebyshevSegments.load(path)
+    else:
+        eph = Ephemeris.from_chebyshev(path)
+    tables = [SunTable.load(os.path.join(directory, 'sun_table_{}.npy'.format(indx)))
+              for indx in range(meta['sun_tables'])]
+    eph._sun_tables = tuple((table.dates.tobytes(), table) for table in tables)
+    afile = meta['afile'] if isinstance(meta['afile'], str) else tuple(meta['afile'])
+    with _ephemeris_registry_lock:
+        _ephemeris_registry[(afile, meta['cnvrt'], meta['interp'])] = eph
+    return eph
+
+
+class HorizonsIndex(object):
+    """Dates and byte offsets of the records of a Horizons vector table.
+
+    Building the index reads the file once but only parses the date of each
+    record; read_lines() then seeks straight to the records of a date range."""
+
+    def __init__(self, afile):
+        self.afile = afile
+        self.center_line = None
+        dates = []
+        offsets = []
+        with open(afile, 'rb') as fin:
+            offset = 0
+            for line in fin:
+                offset += len(line)
+                if line[:5] == b"$$SOE":
+                    break
+                if line.find(b'Center body name:') > -1:
+                    self.center_line = line.decode('ascii', 'replace')
+            else:
+                raise ValueError('No $$SOE record marker found in {}'.format(afile))
+            for line in fin:
+                if line[:5] == b"$$EOE":
+                    break
+                dates.append(float(line[:line.index(b',')]) - 2400000.5)  #represent dates as mjds
+                offsets.append(offset)
+                offset += len(line)
+        self.dates = np.array(dates, dtype=np.float64)
+        self.offsets = np.array(offsets + [offset], dtype=np.int64)  # last entry is the end of the records
+
+    @classmethod
+    def get(cls, afile):
+        """Returns the index of afile, building it only if the file is new or has changed."""
+        path = os.path.abspath(afile)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime, stat.st_size)
+        with _horizons_index_lock:
+            index = _horizons_index_cache.get(key)
+            if index is None:
+                index = cls(path)
+                _horizons_index_cache[key] = index
+        return index
+
+    def read_lines(self, start=None, end=None):
+        """Record lines covering [start, end], including the samples just outside it."""
+        first = 0
+        last = len(self.dates) - 1
+        if start is not None:
+            first = max(int(self.dates.searchsorted(start, side='right')) - 1, 0)
+        if end is not None:
+            last = min(int(self.dates.searchsorted(end, side='left')), last)
+        if last <= first:
+            raise EphemerisRangeError('Date range {} to {} is outside of available ephemeris {} to {}'.format(
+                start, end, self.dates[0], self.dates[-1]))
+        with open(self.afile, 'rb') as fin:
+            fin.seek(self.offsets[first])
+            chunk = fin.read(self.offsets[last+1] - self.offsets[first])
+        return chunk.decode('ascii').splitlines()
 
 
 class Ephemeris:
-    def __init__(self, afile, cnvrt=False, verbose=True):
-        """Eph constructor, cnvrt True converts into Ecliptic frame """
+    _sun_tables = ()  # most recently used last, replaced as a whole under _sun_table_lock
+    _longitude_map = None
+    _max_sun_rate = None
+
+    def __init__(self, afile, cnvrt=False, verbose=True, cache=True, interp='linear', start=None, end=None):
+        """Eph constructor, cnvrt True converts into Ecliptic frame
+
+        With cache True the samples are memory mapped from a compiled copy of
+        afile (see compile_ephemeris), which is created on first use.
+
+        afile may also be a list of files covering adjacent or overlapping
+        spans.  They are merged into one time-ordered set of samples; where
+        spans overlap, the file later in the list replaces the samples of
+        earlier ones over its whole span.
+
+        start and end (MJD) restrict the ephemeris to the samples covering
+        that range.  A Horizons file is then read through its HorizonsIndex,
+        parsing only those records, unless a compiled copy already exists.
+        Files of a list that do not overlap the range are not read.
+
+        interp selects how positions are interpolated between samples:
+        'linear', or 'hermite' for cubic Hermite interpolation using the
+        velocity columns of the ephemeris.  With weekly samples Hermite
+        interpolation reproduces the daily Sun direction to ~0.1 arcsec,
+        except within a sample interval that contains a maneuver.
+        'chebyshev' fits ChebyshevSegments to the samples at load and
+        evaluates those instead."""
+        if interp not in INTERPOLATION_MODES:
+            raise ValueError('Unknown interpolation {}, should be one of {}'.format(interp, INTERPOLATION_MODES))
+        self.interp = interp
         if cnvrt:
             if verbose:
                 print("Using Ecliptic Coordinates")
         else:
             if verbose:
                 print("Using Equatorial Coordinates")
-        self.datelist = []
-        self.xlist = []
-        self.ylist = []
-        self.zlist = []
-        self.amin=0.
-        self.amax=0.
-        aV = Vector(0.,0.,0.)
-        fin = open(afile,'r').readlines()
+        if isinstance(afile, (list, tuple)):
+            pieces = []
+            for a_file in afile:
+                try:
+                    pieces.append(self._load_file(a_file, cnvrt, verbose, cache, start, end))
+                except EphemerisRangeError:
+                    pass  # this file does not cover any of the requested range
+            if not pieces:
+                raise EphemerisRangeError('Date range {} to {} is outside of the available ephemerides'.format(start, end))
+            samples = self._stitch(pieces)
+        else:
+            samples = self._load_file(afile, cnvrt, verbose, cache, start, end)
+        self._set_samples(samples)
+        if interp == 'chebyshev':
+            self.chebyshev = ChebyshevSegments.fit(self)
+
+    @staticmethod
+    def _load_file(afile, cnvrt, verbose, cache, start, end):
+        """Samples of a single ephemeris file, optionally restricted to [start, end]."""
+        samples = None
+        ranged = start is not None or end is not None
+        if cache and (not ranged or _may_have_compiled_copy(afile, cnvrt)):
+            try:
+                path = compiled_ephemeris_path(afile, cnvrt)
+                if not os.path.exists(path) and not ranged:
+                    compile_ephemeris(afile, cnvrt, verbose=verbose)
+                if os.path.exists(path):
+                    samples = np.load(path, mmap_mode='r')
+            except (IOError, OSError, ValueError):
+                samples = None  # unwritable or corrupt cache, fall back to the text file
+        if samples is not None and ranged:
+            samples = Ephemeris._slice_samples(samples, start, end)
+        elif samples is None and ranged and afile.find("horizons_EM")>-1:
+            samples = Ephemeris._read_text_range(afile, cnvrt, verbose, start, end)
+        elif samples is None:
+            samples = Ephemeris._read_text(afile, cnvrt, verbose)
+            if ranged:
+                samples = Ephemeris._slice_samples(samples, start, end)
+        return samples
+
+    @staticmethod
+    def _stitch(pieces):
+        """Merges sample arrays into one time-ordered array.
+
+        Each piece replaces the samples of the pieces before it over its own
+        span, so overlaps are resolved in favour of later pieces and no date
+        appears twice."""
+        merged = np.asarray(pieces[0])
+        for piece in pieces[1:]:
+            piece = np.asarray(piece)
+            keep = (merged[:, 0] < piece[0, 0]) | (merged[:, 0] > piece[-1, 0])
+            merged = np.concatenate((merged[keep], piece))
+        return merged[np.argsort(merged[:, 0], kind='mergesort')]
+
+    @property
+    def coverage(self):
+        """(first, last) MJD covered by the ephemeris."""
+        return (self.amin, self.amax)
+
+    @classmethod
+    def from_chebyshev(cls, segments):
+        """Ephemeris evaluated only from ChebyshevSegments (or a path to saved ones).
+
+        No samples are held, so memory grows with the number of segments."""
+        if not isinstance(segments, ChebyshevSegments):
+            segments = ChebyshevSegments.load(segments)
+        eph = cls.__new__(cls)
+        eph.interp = 'chebyshev'
+        eph.samples = eph.datelist = eph.xyz = eph.vel = None
+        eph.xlist = eph.ylist = eph.zlist = None
+        eph.chebyshev = segments
+        eph.amin = segments.start
+        eph.amax = segments.end
+        return eph
+
+    def _set_samples(self, samples):
+        """Sets the ephemeris from an (N,7) array of [mjd, x, y, z, vx, vy, vz] rows.
+
+        Positions are in km and velocities in km/day.  The dates must be
+        increasing but need not be evenly spaced."""
+        if len(samples) < 2 or np.any(np.diff(samples[:, 0]) <= 0.):
+            raise ValueError('Ephemeris needs at least two samples with increasing dates')
+        if samples.flags.writeable:
+            samples.setflags(write=False)
+        self.samples = samples
+        self.datelist = samples[:, 0]
+        self.xyz = samples[:, 1:4]
+        self.xlist = self.xyz[:, 0]
+        self.ylist = self.xyz[:, 1]
+        self.zlist = self.xyz[:, 2]
+        self.vel = samples[:, 4:7]
+        self.amin = float(self.datelist[0])
+        self.amax = float(self.datelist[-1])
+        self.chebyshev = None
+
+    def decimate(self, every):
+        """Returns a copy of the ephemeris keeping only every n-th sample."""
+        eph = Ephemeris.__new__(Ephemeris)
+        eph.interp = self.interp
+        eph._set_samples(np.ascontiguousarray(self.samples[::every]))
+        if self.chebyshev is not None:
+            eph.chebyshev = ChebyshevSegments.fit(eph, self.chebyshev.radius*2., self.chebyshev.degree)
+        return eph
+
+    @staticmethod
+    def _slice_samples(samples, start, end):
+        """Rows of samples covering [start, end], including the samples just outside it."""
+        dates = samples[:, 0]
+        first = 0 if start is None else max(int(dates.searchsorted(start, side='right')) - 1, 0)
+        last = len(dates) - 1 if end is None else min(int(dates.searchsorted(end, side='left')), len(dates) - 1)
+        if last <= first:
+            raise EphemerisRangeError('Date range {} to {} is outside of available ephemeris {} to {}'.format(
+                start, end, dates[0], dates[-1]))
+        return samples[first:last+1]
+
+    @staticmethod
+    def _parse_horizons_records(lines, ascale, cnvrt):
+        """Parses Horizons vector table records into an (N,7) array of [mjd, x, y, z, vx, vy, vz] rows."""
+        datelist = []
+        xlist = []
+        ylist = []
+        zlist = []
+        vlist = []
+        for line in lines:
+            item=line.strip()
+            item = item.split(',')
+            adate = float(item[0]) - 2400000.5  #represent dates as mjds
+            x = float(item[2])*ascale
+            y = float(item[3])*ascale
+            z = float(item[4])*ascale
+            vx = float(item[5])*ascale*86400.  #km/s to km/day
+            vy = float(item[6])*ascale*86400.
+            vz = float(item[7])*ascale*86400.
+            datelist.append(adate)
+            xlist.append(x)
+            ylist.append(y)
+            zlist.append(z)
+            vlist.append((vx, vy, vz))
+        samples = np.column_stack((datelist, xlist, ylist, zlist, vlist)).astype(np.float64)
+        if cnvrt:
+            Ephemeris._to_ecliptic(samples)
+        return samples
+
+    @staticmethod
+    def _to_ecliptic(samples):
+        """Rotates the positions and velocities of an (N,7) sample array into the ecliptic frame, in place."""
+        samples[:, 1:4] = samples[:, 1:4].dot(Meci2ecl.T)
+        samples[:, 4:7] = samples[:, 4:7].dot(Meci2ecl.T)
+
+    @staticmethod
+    def _check_center(center_line, verbose):
+        """Exits unless the Horizons header line names the Sun as the center body."""
+        if center_line is not None and center_line.find('Sun') > -1:
+            return
+        if verbose and center_line is not None:
+            print(center_line)
+        print("This ephemeris does not use the Sun as the center body.  It should not be used.")
+        exit(-1)
+
+    @staticmethod
+    def _read_text_range(afile, cnvrt, verbose, start, end):
+        """Parses only the Horizons records covering [start, end]."""
+        index = HorizonsIndex.get(afile)
+        Ephemeris._check_center(index.center_line, verbose)
+        return Ephemeris._parse_horizons_records(index.read_lines(start, end), 1.0, cnvrt)
+
+    @staticmethod
+    def _read_text(afile, cnvrt, verbose):
+        """Parses a text ephemeris into an (N,7) array of [mjd, x, y, z, vx, vy, vz] rows."""
         if afile.find("l2_halo_FDF_060619.trh")>-1:
             ascale = 0.001
         else:
             ascale = 1.0
         if afile.find("horizons_EM")>-1:
-            not_there = True
-            istart = 0
-            while fin[istart][:5] != "$$SOE":
-                if fin[istart].find('Center body name:') > -1: # Checks that the Sun is the central body!
-                    if fin[istart].find('Sun') > -1:
-                        not_there = False
-                    else:
-                        if verbose:
-                            print(fin[istart])
-                istart += 1
-            istart += 1
-            if not_there:
-                print("This ephemeris does not use the Sun as the center body.  It should not be used.")
-                exit(-1)
-                
-            while fin[istart][:5] != "$$EOE":
-                item=fin[istart].strip()
-                item = item.split(',')
-                adate = float(item[0]) - 2400000.5  #represent dates as mjds
-                x = float(item[2])*ascale
-                y = float(item[3])*ascale
-                z = float(item[4])*ascale
-                if cnvrt:
-                    aV.set_eq(x,y,z)
-                    ll = aV.length()
-                    aV = aV/ll
-                    aV = Qecl2eci.inv_cnvrt(aV)
-                    aV = aV*ll
-                    x = aV.rx()
-                    y = aV.ry()
-                    z = aV.rz()
-                self.datelist.append(adate)
-                self.xlist.append(x)
-                self.ylist.append(y)
-                self.zlist.append(z)
-                if self.amin==0.:
-                    self.amin = adate
-                istart += 1
+            # Stream the file: skip the header, then parse records up to $$EOE
+            with open(afile,'r') as fin:
+                center_line = None
+                for line in fin:
+                    if line[:5] == "$$SOE":
+                        break
+                    if line.find('Center body name:') > -1: # Checks that the Sun is the central body!
+                        center_line = line
+                Ephemeris._check_center(center_line, verbose)
+                records = itertools.takewhile(lambda line: line[:5] != "$$EOE", fin)
+                return Ephemeris._parse_horizons_records(records, ascale, cnvrt)
         else:
+            datelist = []
+            xlist = []
+            ylist = []
+            zlist = []
+            vlist = []
+            fin = open(afile,'r').readlines()
             for item in fin[2:]:
                 item=string.strip(item)
                 item = string.split(item)
@@ -91,22 +511,11 @@ class Ephemeris:
                 x = float(item[1])*ascale
                 y = float(item[2])*ascale
                 z = float(item[3])*ascale
-                if cnvrt:
-                    aV.set_eq(x,y,z)
-                    ll = aV.length()
-                    aV = aV/ll
-                    aV = Qecl2eci.inv_cnvrt(aV)
-                    aV = aV*ll
-                    x = aV.rx()
-                    y = aV.ry()
-                    z = aV.rz()
-                self.datelist.append(adate)
-                self.xlist.append(x)
-                self.ylist.append(y)
-                self.zlist.append(z)
-                if self.amin==0.:
-                    self.amin = adate 
-        self.amax = adate
+                datelist.append(adate)
+                xlist.append(x)
+                ylist.append(y)
+                zlist.append(z)
+                vlist.append((nan, nan, nan))  # no velocities in this format
         ##yp = spline(xa,ya,0.,0.)
         #Saving spline parameters
         #self.xlistp = spline(self.datelist,self.xlist,1.e31,1.e31)
@@ -114,6 +523,10 @@ class Ephemeris:
         #self.zlistp = spline(self.datelist,self.zlist,1.e31,1.e31)
         del fin
         #print len(self.datelist),len(self.xlist),len(self.ylist),len(self.zlist)
+        samples = np.column_stack((datelist, xlist, ylist, zlist, vlist)).astype(np.float64)
+        if cnvrt:
+            Ephemeris._to_ecliptic(samples)
+        return samples
         
     def report_ephemeris (self, limit=100000, pathname=None):
         """Prints a formatted report of the ephemeris.
@@ -142,13 +555,38 @@ class Ephemeris:
         if (pathname):
             dest.close()   #Clean up
            
+    def _check_range(self,dates):
+        """Raises ValueError for dates outside the ephemeris."""
+        inside = (dates >= self.amin) & (dates <= self.amax)
+        if not np.all(inside):
+            raise EphemerisRangeError('Date {} outside of available ephemeris {} to {}'.format(
+                np.atleast_1d(dates)[~np.atleast_1d(inside)][0], self.amin, self.amax))
+
+    def _interpolate(self,indx,frac,interp):
+        """Position at fraction frac of the way from sample indx to indx+1."""
+        p0 = self.xyz[indx]
+        p1 = self.xyz[indx+1]
+        if interp == 'hermite':
+            step = self.datelist[indx+1] - self.datelist[indx]
+            if np.ndim(step):
+                step = step[:, np.newaxis]
+            m0 = self.vel[indx]*step
+            m1 = self.vel[indx+1]*step
+            frac2 = frac*frac
+            frac3 = frac2*frac
+            return ((2.*frac3 - 3.*frac2 + 1.)*p0 + (frac3 - 2.*frac2 + frac)*m0 +
+                    (3.*frac2 - 2.*frac3)*p1 + (frac3 - frac2)*m1)
+        return (p1 - p0)*frac + p0
+
     def pos(self,adate):
-        cal_days = adate - self.datelist[0]
-        indx = int(cal_days)
-        frac = cal_days - indx
-        x = (self.xlist[indx+1] - self.xlist[indx])*frac + self.xlist[indx]  
-        y = (self.ylist[indx+1] - self.ylist[indx])*frac + self.ylist[indx]  
-        z = (self.zlist[indx+1] - self.zlist[indx])*frac + self.zlist[indx]  
+        if not (self.amin <= adate <= self.amax):
+            self._check_range(adate)
+        if self.chebyshev is not None:
+            (x, y, z) = self.chebyshev.pos_many(np.array([adate], dtype=np.float64))[0].tolist()
+            return Vector(x,y,z)
+        indx = min(int(self.datelist.searchsorted(adate, side='right')) - 1, len(self.datelist) - 2)
+        frac = (adate - self.datelist[indx])/(self.datelist[indx+1] - self.datelist[indx])
+        (x, y, z) = self._interpolate(indx, frac, self.interp).tolist()
         return Vector(x,y,z)
         #alower = float(int(adate - 0.5)) + 0.5
         #if alower>= self.amin and adate>= self.amin and adate<=self.amax:
@@ -161,11 +599,120 @@ class Ephemeris:
 ##        #splint(xa,ya,yp,x)
 ##        return Vector(x,y,z)
 
+    def pos_many(self,dates):
+        """Interpolated positions for an array of dates, returned as an (N,3) array."""
+        dates = np.atleast_1d(np.asarray(dates, dtype=np.float64))
+        self._check_range(dates)
+        if self.chebyshev is not None:
+            return self.chebyshev.pos_many(dates)
+        return self._sample_pos(dates, self.interp)
+
+    def _sample_pos(self,dates,interp):
+        """Positions interpolated from the samples with the given method.
+
+        The bracketing samples are found by binary search, so any increasing
+        sample grid works."""
+        indx = np.minimum(self.datelist.searchsorted(dates, side='right') - 1, len(self.datelist) - 2)
+        frac = ((dates - self.datelist[indx])/(self.datelist[indx+1] - self.datelist[indx]))[:, np.newaxis]
+        return self._interpolate(indx, frac, interp)
+
+    def _cached_sun(self,dates):
+        """(table, rows) of a cached SunTable having every one of dates on its grid, or None."""
+        dates = np.atleast_1d(np.asarray(dates, dtype=np.float64))
+        if not len(dates):
+            return None
+        for (key, table) in reversed(self._sun_tables):
+            if table.lookup(dates[0]) is None:
+                continue
+            rows = np.minimum(table.dates.searchsorted(dates), len(table.dates) - 1)
+            if np.array_equal(table.dates[rows], dates):
+                return (table, rows)
+        return None
+
+    def sun_unit_vectors(self,dates):
+        """Unit vectors towards the Sun for an array of dates, returned as an (N,3) array.
+
+        Dates on the grid of a cached SunTable are read from it."""
+        cached = self._cached_sun(dates)
+        if cached is not None:
+            return cached[0].vectors[cached[1]]
+        Vsun = -self.pos_many(dates)
+        Vsun /= np.sqrt(np.einsum('ij,ij->i', Vsun, Vsun))[:, np.newaxis]
+        return Vsun
+
+    def sun_pos_many(self,dates):
+        """Sun (coord1, coord2) in radians for an array of dates, as two arrays.
+
+        Dates on the grid of a cached SunTable are read from it, so callers
+        evaluating targets on a grid share its Sun computation."""
+        cached = self._cached_sun(dates)
+        if cached is not None:
+            (table, rows) = cached
+            return (table.ra[rows], table.dec[rows])
+        Vsun = self.sun_unit_vectors(dates)
+        coord2 = np.arcsin(np.clip(Vsun[:, 2], -1., 1.))
+        coord1 = np.arctan2(Vsun[:, 1], Vsun[:, 0])
+        coord1[coord1 < 0.] += PI2
+        return (coord1, coord2)
+
+    def sun_table(self,dates):
+        """Returns the SunTable for a grid of dates, computing it on first request.
+
+        While the table is cached, sun_pos() reads dates on the grid from it,
+        so in_FOR, normal_pa, is_valid and the bisections share one Sun
+        computation per grid date across all targets.  The cache holds at
+        most SUN_TABLE_CACHE_BYTES of tables besides the one just returned."""
+        dates = np.asarray(dates, dtype=np.float64)
+        key = dates.tobytes()
+        table = dict(self._sun_tables).get(key)
+        if table is None:
+            # Computed outside the lock so threads needing other grids are not held up
+            table = SunTable(self, dates)
+        with _sun_table_lock:
+            tables = collections.OrderedDict(self._sun_tables)
+            table = tables.pop(key, table)
+            tables[key] = table
+            # The least recently used tables go first, until the rest fit in SUN_TABLE_CACHE_BYTES
+            total = sum(cached.nbytes for cached in tables.values())
+            while len(tables) > 1 and total > SUN_TABLE_CACHE_BYTES:
+                total -= tables.popitem(last=False)[1].nbytes
+            self._sun_tables = tuple(tables.items())
+        return table
+
+    def sun_longitude_map(self):
+        """Returns the SunLongitudeMap of this ephemeris, building it on first use."""
+        longitude_map = self._longitude_map
+        if longitude_map is None:
+            longitude_map = SunLongitudeMap(self)
+            self._longitude_map = longitude_map
+        return longitude_map
+
+    def max_sun_rate(self):
+        """Upper bound of the Sun's angular rate as seen from the telescope, in radians per day.
+
+        The largest angle between the Sun directions of consecutive dates,
+        SUN_RATE_STEP days apart over the whole coverage, over their spacing
+        and padded by SUN_RATE_MARGIN.  No Sun separation can change faster,
+        whatever the fixed target.  Only the coverage is used, so this also
+        works for ephemerides built with from_chebyshev()."""
+        rate = self._max_sun_rate
+        if rate is None:
+            dates = np.linspace(self.amin, self.amax, int(ceil((self.amax - self.amin)/SUN_RATE_STEP)) + 1)
+            vectors = self.sun_unit_vectors(dates)
+            cos_step = np.clip(np.einsum('ij,ij->i', vectors[:-1], vectors[1:]), -1., 1.)
+            rate = float((np.arccos(cos_step)/np.diff(dates)).max()) * SUN_RATE_MARGIN
+            self._max_sun_rate = rate
+        return rate
+
     def Vsun_pos(self,adate):
         Vsun = -1. * self.pos(adate)
         Vsun = Vsun / Vsun.length()
         return Vsun
     def sun_pos(self,adate):
+        for (key, table) in self._sun_tables:
+            coords = table.lookup(adate)
+            if coords is not None:
+                return coords
         Vsun = -1. * self.pos(adate)
         Vsun = Vsun / Vsun.length()
         coord2 = asin(unit_limit(Vsun.z))
@@ -181,6 +728,13 @@ class Ephemeris:
         if V3_pa >= PI2 : V3_pa -= PI2
         return V3_pa
 
+    def normal_pa_many(self,dates,tgt_c1,tgt_c2):
+        """normal_pa() for an array of dates; target coordinates broadcast against it."""
+        (sun_c1, sun_c2) = self.sun_pos_many(dates)
+        V3_pa = astro_func.pa_many(tgt_c1,tgt_c2,sun_c1,sun_c2) + pi  # We want -V3 pointed towards sun.
+        V3_pa = np.where(V3_pa < 0., V3_pa + PI2, V3_pa)
+        return np.where(V3_pa >= PI2, V3_pa - PI2, V3_pa)
+
     def is_valid(self,date,coord_1,coord_2,V3pa):
         """Indicates whether an attitude is valid at a given date."""
         
@@ -203,6 +757,43 @@ class Ephemeris:
                 return True
         return False
 
+    def is_valid_many(self,dates,coord_1,coord_2,V3pa):
+        """is_valid() over an array of dates and, optionally, of V3 PAs.
+
+        The target coordinates may be scalars, arrays matching dates or, to
+        check many targets, (N,1) columns broadcast against the dates.  For
+        a scalar V3pa the result is a boolean array matching dates; for an
+        array of PAs it has one row per PA, so a whole set of candidate
+        attitudes is checked against the grid at once."""
+        dates = np.asarray(dates, dtype=np.float64)
+        V3pa = np.asarray(V3pa, dtype=np.float64)[..., np.newaxis]
+        shape = np.broadcast(V3pa, np.asarray(coord_1), np.asarray(coord_2), dates).shape
+        valid = np.zeros(shape, dtype=bool)
+
+        #Dates outside the time interval of the ephemeris are never valid.
+        inside = (dates >= self.amin) & (dates <= self.amax)
+        if not inside.any():
+            return valid
+        if not inside.all():
+            coord_1 = np.broadcast_to(coord_1, shape)[..., inside]
+            coord_2 = np.broadcast_to(coord_2, shape)[..., inside]
+        table = self.sun_table(dates[inside])
+        valid[..., inside] = self._attitude_ok(table.ra, table.dec, coord_1, coord_2, V3pa)
+        return valid
+
+    @staticmethod
+    def _attitude_ok(sun_1,sun_2,coord_1,coord_2,V3pa):
+        """Sun angle, sun roll and sun pitch limits of is_valid() on arrays."""
+        d = astro_func.dist_many(coord_1, coord_2, sun_1, sun_2)
+        vehicle_pitch = pi/2 - d   #see JI memo from May 2006
+        pa = astro_func.pa_many(coord_1, coord_2, sun_1, sun_2) + pi
+        roll = np.arccos(np.cos(V3pa - pa))
+        sun_roll = np.arcsin(np.sin(roll) * np.cos(vehicle_pitch))
+        sun_pitch = np.arctan2(np.tan(vehicle_pitch), np.cos(roll))
+        return ((d >= MIN_SUN_ANGLE) & (d <= MAX_SUN_ANGLE) &
+                (np.abs(sun_roll) <= 5.2*D2R) &
+                (sun_pitch <= 5.0*D2R) & (sun_pitch >= -44.8*D2R))
+
     def in_FOR(self,adate,coord_1,coord_2):
         (sun_1,sun_2) = self.sun_pos(adate)
         d = astro_func.dist(coord_1,coord_2,sun_1,sun_2)
@@ -212,10 +803,93 @@ class Ephemeris:
             return False
         return True
 
-    def bisect_by_FOR(self,in_date,out_date,coord_1,coord_2):#in and out of FOR, assumes only one "root" in interval
+    def in_FOR_many(self,dates,coord_1,coord_2):
+        """in_FOR() over an array of dates, returned as a boolean array.
+
+        The target coordinates may be scalars or arrays matching dates.
+        Dates on the grid of a cached SunTable are read from it, otherwise
+        the table of dates is computed and cached."""
+        cached = self._cached_sun(dates)
+        (table, rows) = cached if cached is not None else (self.sun_table(dates), Ellipsis)
+        d = astro_func.dist_many(coord_1, coord_2, table.ra[rows], table.dec[rows])
+        return (d >= MIN_SUN_ANGLE) & (d <= MAX_SUN_ANGLE)
+
+    def step_FOR_many(self,start,end,coord_1,coord_2,min_step=ADAPTIVE_MIN_STEP,max_step=ADAPTIVE_MAX_STEP,
+                      graze_step=ADAPTIVE_GRAZE_STEP):
+        """Brackets the field of regard entries and exits of fixed targets with adaptive steps.
+
+        Each target is sampled from start to end (MJD), every step going as
+        far as its Sun separation cannot reach a limit: the margin to the
+        nearest of MIN_SUN_ANGLE and MAX_SUN_ANGLE over max_sun_rate(), kept
+        within [min_step, max_step].  Far from the limits the steps are weeks
+        long and they only shrink to min_step next to a crossing.  The Sun is
+        only evaluated at the dates stepped to.
+
+        A step can only hold a crossing if the margins at its two ends add
+        up to no more than the Sun can move over it.  Those steps are halved
+        until they are graze_step long, keeping only the halves that could
+        still hold one, so a target grazing a limit is found unless its
+        excursion is shorter than graze_step.
+
+        Returns (target, before, after, entering, first, last): one row per
+        transition, in time order for each target, with the target index,
+        the dates bracketing it and whether it enters the field of regard,
+        then the in/out state of every target at start and at end."""
+        coord_1 = np.atleast_1d(np.asarray(coord_1, dtype=np.float64))
+        coord_2 = np.atleast_1d(np.asarray(coord_2, dtype=np.float64))
+        (start, end) = (float(start), float(end))
+        rate = self.max_sun_rate()
+
+        def separation(targets, dates):
+            (sun_1, sun_2) = self.sun_pos_many(dates)
+            return astro_func.dist_many(coord_1[targets], coord_2[targets], sun_1, sun_2)
+        margin = lambda d: np.minimum(np.abs(d - MIN_SUN_ANGLE), np.abs(d - MAX_SUN_ANGLE))
+        inside = lambda d: (d >= MIN_SUN_ANGLE) & (d <= MAX_SUN_ANGLE)
+
+        #Coarse steps, keeping those a limit could be reached in.
+        active = np.arange(len(coord_1))
+        dates = np.full(len(coord_1), start)
+        d = separation(active, dates)
+        first = inside(d)
+        last = first.copy()
+        suspect = [(active[:0], dates[:0], dates[:0], d[:0], d[:0])]
+        while len(active):
+            after = np.minimum(dates + np.clip(margin(d)/rate, min_step, max_step), end)
+            d_after = separation(active, after)
+            k = np.flatnonzero(margin(d) + margin(d_after) <= rate*(after - dates))
+            suspect.append((active[k], dates[k], after[k], d[k], d_after[k]))
+            last[active] = inside(d_after)
+            going = after < end
+            (active, dates, d) = (active[going], after[going], d_after[going])
+
+        #Halve the suspect steps down to graze_step; short ones changing state bracket a transition.
+        (target, before, after, d_before, d_after) = [np.concatenate(column) for column in zip(*suspect)]
+        found = [(target[:0], before[:0], after[:0], first[:0])]
+        while len(target):
+            flips = inside(d_before) != inside(d_after)
+            short = after - before <= graze_step
+            k = np.flatnonzero(short & flips)
+            found.append((target[k], before[k], after[k], inside(d_after[k])))
+            k = np.flatnonzero(~short)
+            (target, before, after, d_before, d_after) = (target[k], before[k], after[k], d_before[k], d_after[k])
+            mid = (before + after)/2.
+            d_mid = separation(target, mid)
+            (target, before, after, d_before, d_after) = (np.concatenate((target, target)), np.concatenate((before, mid)),
+                                                          np.concatenate((mid, after)), np.concatenate((d_before, d_mid)),
+                                                          np.concatenate((d_mid, d_after)))
+            keep = ((margin(d_before) + margin(d_after) <= rate*(after - before))
+                    | (inside(d_before) != inside(d_after)))
+            (target, before, after, d_before, d_after) = (target[keep], before[keep], after[keep],
+                                                          d_before[keep], d_after[keep])
+
+        (target, before, after, entering) = [np.concatenate(column) for column in zip(*found)]
+        order = np.lexsort((before, target))
+        return (target[order], before[order], after[order], entering[order], first, last)
+
+    def bisect_by_FOR(self,in_date,out_date,coord_1,coord_2,tol=BISECT_TOLERANCE):#in and out of FOR, assumes only one "root" in interval
         delta_days = 200.
         mid_date = (in_date+out_date)/2.
-        while delta_days > 0.000001:
+        while delta_days > tol:
             (sun_1,sun_2) = self.sun_pos(mid_date)
             d = astro_func.dist(coord_1,coord_2,sun_1,sun_2)
             if (d>MAX_SUN_ANGLE or d<MIN_SUN_ANGLE):
@@ -226,17 +900,17 @@ class Ephemeris:
             delta_days = abs(in_date-out_date)/2.
             #print "UU", mid_date
         if in_date>out_date:# ensure returned date always in FOR
-            mid_date = mid_date + 0.000001
+            mid_date = mid_date + tol
         else:
-            mid_date = mid_date - 0.000001
+            mid_date = mid_date - tol
         return mid_date
 
-    def bisect_by_attitude(self,in_date,out_date,coord_1,coord_2,pa):#in and out of FOR, assumes only one "root" in interval
+    def bisect_by_attitude(self,in_date,out_date,coord_1,coord_2,pa,tol=BISECT_TOLERANCE):#in and out of FOR, assumes only one "root" in interval
         icount = 0
         delta_days = 200.
         mid_date = (in_date+out_date)/2.
         #print "bisect >",in_date,out_date,abs(in_date-out_date )
-        while delta_days > 0.000001:
+        while delta_days > tol:
             if self.is_valid(mid_date,coord_1,coord_2,pa):
                 in_date = mid_date
             else:
@@ -248,6 +922,303 @@ class Ephemeris:
         #print " bisected >",icount
         return mid_date
 
+    def bisect_many(self,in_dates,out_dates,coord_1,coord_2,V3pa=None,tol=BISECT_TOLERANCE):
+        """Refines a set of bracketed window edges together.
+
+        Each (in_dates[k], out_dates[k]) pair brackets one edge of the target
+        at (coord_1[k], coord_2[k]); the coordinates may also be scalars.
+        Without V3pa the edges are those of the field of regard and the
+        results match bisect_by_FOR(), including the final step of tol into
+        the field of regard; with V3pa (scalar or one PA per edge) they match
+        bisect_by_attitude().  Every iteration evaluates the Sun for all
+        unconverged edges at once, so the edges of many windows and targets
+        cost one vectorized bisection."""
+        in_dates = np.array(in_dates, dtype=np.float64, ndmin=1)
+        out_dates = np.array(out_dates, dtype=np.float64, ndmin=1)
+        coord_1 = np.broadcast_to(coord_1, in_dates.shape)
+        coord_2 = np.broadcast_to(coord_2, in_dates.shape)
+        if V3pa is not None:
+            V3pa = np.broadcast_to(V3pa, in_dates.shape)
+        mid_dates = (in_dates+out_dates)/2.
+        active = np.ones(in_dates.shape, dtype=bool)
+        while active.any():
+            k = np.flatnonzero(active)
+            mid = mid_dates[k]
+            if V3pa is None:
+                (sun_1, sun_2) = self.sun_pos_many(mid)
+                d = astro_func.dist_many(coord_1[k], coord_2[k], sun_1, sun_2)
+                ok = (d >= MIN_SUN_ANGLE) & (d <= MAX_SUN_ANGLE)
+            else:
+                #As in is_valid, dates outside the ephemeris are not valid.
+                (sun_1, sun_2) = self.sun_pos_many(np.clip(mid, self.amin, self.amax))
+                ok = self._attitude_ok(sun_1, sun_2, coord_1[k], coord_2[k], V3pa[k])
+                ok &= (mid >= self.amin) & (mid <= self.amax)
+            in_dates[k] = np.where(ok, mid, in_dates[k])
+            out_dates[k] = np.where(ok, out_dates[k], mid)
+            mid_dates[k] = (in_dates[k]+out_dates[k])/2.
+            active[k] = np.abs(in_dates[k]-out_dates[k])/2. > tol
+        if V3pa is None:# ensure returned dates always in FOR
+            mid_dates = np.where(in_dates>out_dates, mid_dates + tol, mid_dates - tol)
+        return mid_dates
+
+
+class SunTable(object):
+    """Sun directions precomputed on a grid of dates.
+
+    dates, vectors (N,3 unit vectors towards the Sun), ra and dec (radians)
+    are read-only arrays; lookup() reads the Sun position at a grid date.
+    No per-date Python objects are kept, so fine grids over the whole
+    ephemeris stay as compact as their arrays."""
+
+    def __init__(self, eph, dates):
+        self.dates = np.array(dates, dtype=np.float64)
+        self.vectors = eph.sun_unit_vectors(self.dates)
+        (self.ra, self.dec) = eph.sun_pos_many(self.dates)
+        self._index()
+
+    def _index(self):
+        """Freezes the arrays read by Ephemeris.sun_pos."""
+        for array in (self.dates, self.vectors, self.ra, self.dec):
+            if array.flags.writeable:
+                array.setflags(write=False)
+
+    def lookup(self, adate):
+        """Sun (coord1, coord2) at adate as Python floats, or None if adate is not a grid date."""
+        indx = int(self.dates.searchsorted(adate))
+        if indx < len(self.dates) and self.dates[indx] == adate:
+            return (float(self.ra[indx]), float(self.dec[indx]))
+        return None
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the arrays of the table."""
+        return sum(array.nbytes for array in (self.dates, self.vectors, self.ra, self.dec))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Reads a table saved with save(), memory mapped by default."""
+        columns = np.load(path, mmap_mode='r' if mmap else None)
+        table = cls.__new__(cls)
+        table.dates = columns[:, 0]
+        table.vectors = columns[:, 1:4]
+        table.ra = columns[:, 4]
+        table.dec = columns[:, 5]
+        table._index()
+        return table
+
+    def save(self, path):
+        """Writes the table to a .npy file as (N,6) rows of [date, vector, ra, dec]."""
+        np.save(path, np.column_stack((self.dates, self.vectors, self.ra, self.dec)))
+
+
+class SunLongitudeMap(object):
+    """Inverse of the Sun's longitude along its apparent path, for fixed-target windows.
+
+    Seen from the telescope the Sun moves monotonically, at about 1 deg/day,
+    along a path within 0.15 deg of a great circle.  The pole of that circle
+    is fitted to the Sun directions, so the map works in the frame of the
+    ephemeris whether equatorial or ecliptic.  Neglecting the Sun's latitude
+    the separation of a fixed target only depends on its longitude
+    difference to the Sun, so the longitudes where it crosses MIN_SUN_ANGLE
+    and MAX_SUN_ANGLE are solved for directly and mapped back to dates with
+    the inverse of the Sun's longitude.  A few secant steps on the actual
+    separation then bring each edge to the requested tolerance.
+
+    Targets whose latitude is within max_latitude + LONGITUDE_MAP_MARGIN of
+    a tangency (|latitude| near MIN_SUN_ANGLE or pi - MAX_SUN_ANGLE), where
+    the Sun's latitude decides whether the separation limit is reached at
+    all, are left to the caller to scan."""
+
+    def __init__(self, eph, step=LONGITUDE_MAP_STEP):
+        self.eph = eph
+        self.dates = np.linspace(eph.amin, eph.amax, int(ceil((eph.amax - eph.amin)/step)) + 1)
+        vectors = eph.sun_unit_vectors(self.dates)
+        pole = np.cross(vectors[:-1], vectors[1:]).sum(axis=0)
+        pole /= np.sqrt(np.dot(pole, pole))
+        x_axis = vectors[0] - np.dot(vectors[0], pole)*pole
+        x_axis /= np.sqrt(np.dot(x_axis, x_axis))
+        self.axes = np.array([x_axis, np.cross(pole, x_axis), pole])  # rows of the rotation into the path frame
+        (longitudes, latitudes) = self.lonlat(vectors)
+        self.longitudes = np.unwrap(longitudes)
+        self.latitudes = latitudes
+        if np.any(np.diff(self.longitudes) <= 0.):
+            raise ValueError('The Sun longitude of this ephemeris is not monotonic')
+        self.max_latitude = float(np.abs(latitudes).max())
+        for array in (self.dates, self.axes, self.longitudes, self.latitudes):
+            array.setflags(write=False)
+
+    def lonlat(self, vectors):
+        """Longitudes and latitudes (radians) of (N,3) unit vectors in the frame of the Sun's path."""
+        v = np.dot(vectors, self.axes.T)
+        return (np.arctan2(v[:, 1], v[:, 0]), np.arcsin(np.clip(v[:, 2], -1., 1.)))
+
+    def date_of(self, longitude):
+        """Dates at which the Sun reaches the given unwrapped longitudes."""
+        return np.interp(longitude, self.longitudes, self.dates)
+
+    def windows(self, ra, dec, start, end, tol=BISECT_TOLERANCE, max_iter=8):
+        """Field of regard windows of fixed targets between start and end (MJD).
+
+        ra and dec are arrays in radians.  Returns (target, wstart, wend, cvz,
+        fallback): one row per window with the target index and its edges,
+        which are moved by tol into the window like those of bisect_by_FOR
+        and clipped to [start, end], then boolean arrays over the targets.
+        cvz flags targets in the field of regard over the whole interval,
+        fallback those near a tangency or whose edges did not converge,
+        which get no windows here."""
+        ra = np.atleast_1d(np.asarray(ra, dtype=np.float64))
+        dec = np.atleast_1d(np.asarray(dec, dtype=np.float64))
+        targets = np.column_stack((np.cos(dec)*np.cos(ra), np.cos(dec)*np.sin(ra), np.sin(dec)))
+        (lon, lat) = self.lonlat(targets)
+        abs_lat = np.abs(lat)
+        margin = self.max_latitude + LONGITUDE_MAP_MARGIN
+        fallback = ((np.abs(abs_lat - MIN_SUN_ANGLE) < margin) |
+                    (np.abs(abs_lat - (pi - MAX_SUN_ANGLE)) < margin))
+
+        #Longitude differences to the Sun where the separation crosses the limits.
+        cos_lat = np.cos(lat)
+        d_in = np.arccos(np.clip(cos(MIN_SUN_ANGLE)/cos_lat, -1., 1.))
+        d_out = np.arccos(np.clip(cos(MAX_SUN_ANGLE)/cos_lat, -1., 1.))
+        offsets = np.column_stack((-d_out, -d_in, d_in, d_out))
+        entering = np.array([True, False, True, False])
+        bounds = np.array([MAX_SUN_ANGLE, MIN_SUN_ANGLE, MIN_SUN_ANGLE, MAX_SUN_ANGLE])
+        present = np.column_stack((abs_lat < pi - MAX_SUN_ANGLE, abs_lat < MIN_SUN_ANGLE,
+                                   abs_lat < MIN_SUN_ANGLE, abs_lat < pi - MAX_SUN_ANGLE))
+        present &= ~fallback[:, np.newaxis]
+
+        #Every crossing over [start, end], in time order for each target.  The
+        #range is padded as these first guesses neglect the Sun's latitude.
+        (first, last) = np.interp([start, end], self.dates, self.longitudes)
+        pad = LONGITUDE_MAP_PAD
+        turns = np.arange(floor(first/PI2) - 1, ceil(last/PI2) + 2) * PI2
+        ev_lon = lon[:, np.newaxis, np.newaxis] + turns[np.newaxis, :, np.newaxis] + offsets[:, np.newaxis, :]
+        valid = present[:, np.newaxis, :] & (ev_lon >= first - pad) & (ev_lon <= last + pad)
+        (tgt, turn, kind) = np.nonzero(valid)
+        ev_lon = ev_lon[tgt, turn, kind]
+
+        #Redo the solution with the Sun's latitude at the guessed dates.
+        base = lon[tgt] + turns[turn]
+        side = np.where(kind < 2, -1., 1.)
+        (sin_lat, cos_lat) = (np.sin(lat[tgt]), cos_lat[tgt])
+        for i in range(2):
+            sun_lat = np.interp(self.date_of(ev_lon), self.dates, self.latitudes)
+            cos_offset = (np.cos(bounds[kind]) - sin_lat*np.sin(sun_lat))/(cos_lat*np.cos(sun_lat))
+            ev_lon = base + side*np.arccos(np.clip(cos_offset, -1., 1.))
+        edges = self._refine(self.date_of(ev_lon), targets[tgt], bounds[kind], tol, max_iter)
+        entering = entering[kind]
+
+        failed = np.zeros(len(ra), dtype=bool)
+        failed[tgt[np.isnan(edges)]] = True
+        fallback |= failed
+        keep = ~failed[tgt] & (edges > start) & (edges < end)
+        (tgt, edges, entering) = (tgt[keep], edges[keep], entering[keep])
+        edges = np.clip(np.where(entering, edges + tol, edges - tol), start, end)
+
+        #A target starts inside if its first crossing is an exit, and ends inside if its last is an entry.
+        (sun_1, sun_2) = self.eph.sun_pos_many([start])
+        d = astro_func.dist_many(ra, dec, sun_1, sun_2)
+        starts_in = (d >= MIN_SUN_ANGLE) & (d <= MAX_SUN_ANGLE)
+        ends_in = np.zeros(len(ra), dtype=bool)
+        has_events = np.zeros(len(ra), dtype=bool)
+        (event_tgt, first_indx, counts) = np.unique(tgt, return_index=True, return_counts=True)
+        has_events[event_tgt] = True
+        starts_in[event_tgt] = ~entering[first_indx]
+        ends_in[event_tgt] = entering[first_indx + counts - 1]
+
+        open_start = np.flatnonzero(has_events & starts_in)
+        open_end = np.flatnonzero(ends_in)
+        start_tgt = np.concatenate((open_start, tgt[entering]))
+        wstart = np.concatenate((np.full(len(open_start), float(start)), edges[entering]))
+        order = np.lexsort((wstart, start_tgt))
+        end_tgt = np.concatenate((tgt[~entering], open_end))
+        wend = np.concatenate((edges[~entering], np.full(len(open_end), float(end))))
+        cvz = ~has_events & starts_in & ~fallback
+        return (start_tgt[order], wstart[order], wend[np.lexsort((wend, end_tgt))], cvz, fallback)
+
+    def _refine(self, dates, targets, bounds, tol, max_iter):
+        """Secant iterations for the dates where the Sun separation of targets equals bounds.
+
+        Returns NaN for edges that did not converge near their first guess.
+        Edges beyond the ephemeris converge onto its ends."""
+        dates = np.clip(dates, self.eph.amin, self.eph.amax)
+        guess = dates
+        def excess(t):
+            vectors = self.eph.sun_unit_vectors(np.clip(t, self.eph.amin, self.eph.amax))
+            return np.arccos(np.clip(np.einsum('ij,ij->i', vectors, targets), -1., 1.)) - bounds
+        (t0, t1) = (dates, np.where(dates + 0.01 <= self.eph.amax, dates + 0.01, dates - 0.01))
+        (g0, g1) = (excess(t0), excess(t1))
+        step = np.full(len(dates), np.inf)
+        for i in range(max_iter):
+            slope = g1 - g0
+            step = np.where(slope != 0., g1*(t1 - t0)/np.where(slope != 0., slope, 1.), 0.)
+            (t0, g0) = (t1, g1)
+            t1 = t1 - step
+            if not np.any(np.abs(step) > tol/10.):
+                break
+            g1 = excess(t1)
+        return np.where((np.abs(step) <= tol) & (np.abs(t1 - guess) < 2.), t1, np.nan)
+
+
+class ChebyshevSegments(object):
+    """Ephemeris positions as a set of Chebyshev polynomial segments.
+
+    Records follow the layout of SPICE type 2 segments: one row per
+    equal-length segment holding [MID, RADIUS, X coeffs, Y coeffs, Z coeffs],
+    with times in MJD and positions in km.  Evaluating a date costs one
+    index computation and a Clenshaw recurrence, independent of the span."""
+
+    def __init__(self, records):
+        self.records = records
+        self.mid = records[:, 0]
+        self.radius = float(records[0, 1])
+        self.degree = (records.shape[1] - 2)//3 - 1
+        self.coeffs = records[:, 2:].reshape(len(records), 3, self.degree + 1)
+        self.start = float(self.mid[0]) - self.radius
+        self.end = float(self.mid[-1]) + self.radius
+
+    @classmethod
+    def fit(cls, eph, seg_days=16., degree=12):
+        """Fits segments of about seg_days to an Ephemeris with samples.
+
+        Each segment is a least-squares fit to the Hermite interpolant of the
+        samples at 2*(degree+1) Chebyshev nodes.  The segment length is
+        shortened so that a whole number of segments spans the ephemeris."""
+        span = eph.amax - eph.amin
+        nseg = max(1, int(ceil(span/seg_days - 1e-9)))
+        radius = span/nseg/2.
+        nnodes = 2*(degree + 1)
+        nodes = np.cos(pi*(np.arange(nnodes) + 0.5)/nnodes)
+        mid = eph.amin + radius*(2.*np.arange(nseg) + 1.)
+        dates = np.clip((mid[:, np.newaxis] + radius*nodes).ravel(), eph.amin, eph.amax)
+        # The nodes are the same for every segment, so a single solve fits them all
+        xyz = eph._sample_pos(dates, 'hermite').reshape(nseg, nnodes, 3)
+        vander = np.polynomial.chebyshev.chebvander(nodes, degree)
+        coeffs = np.linalg.lstsq(vander, xyz.transpose(1, 0, 2).reshape(nnodes, -1), rcond=None)[0]
+        coeffs = coeffs.reshape(degree + 1, nseg, 3).transpose(1, 2, 0)
+        records = np.column_stack((mid, np.full(nseg, radius), coeffs.reshape(nseg, -1)))
+        return cls(records)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Reads segments saved with save(), memory mapped by default."""
+        return cls(np.load(path, mmap_mode='r' if mmap else None))
 
+    def save(self, path):
+        """Writes the segment records to a .npy file."""
+        np.save(path, np.asarray(self.records))
 
-    
+    def pos_many(self, dates):
+        """Positions for an array of dates, returned as an (N,3) array."""
+        dates = np.atleast_1d(np.asarray(dates, dtype=np.float64))
+        indx = np.clip(((dates - self.start)/(2.*self.radius)).astype(np.intp), 0, len(self.mid) - 1)
+        s = ((dates - self.mid[indx])/self.radius)[:, np.newaxis]
+        coeffs = self.coeffs[indx]
+        # Clenshaw recurrence, vectorized over dates and axes
+        b1 = np.zeros((len(dates), 3))
+        b2 = np.zeros((len(dates), 3))
+        for k in range(self.degree, 0, -1):
+            (b1, b2) = (coeffs[:, :, k] + 2.*s*b1 - b2, b1)
+        return coeffs[:, :, 0] + s*b1 - b2
@@ -4,25 +4,26 @@ from __future__ import print_function
 
 import sys
 import math
+import functools
+import heapq
+import concurrent.futures
+import shutil
+import tempfile
+import threading
 
 
 import argparse
 from astropy.time import Time
 from astropy.table import Table
 from astroquery.jplhorizons import Horizons
-import matplotlib.pyplot as plt
-
-import matplotlib
-# Use TkAgg backend by default, but don't change backend if called from a Jupyter notebook with inline plots
-if 'module://ipykernel.pylab.backend_inline' not in matplotlib.rcParams['backend']:
-    matplotlib.use('TkAgg')
 
 from matplotlib.dates import YearLocator, MonthLocator, DateFormatter
 import numpy as np
-from os.path import join, abspath, dirname
+from math import ceil
 import warnings
 
 from . import ephemeris_old2x as EPH
+from . import astro_funcx as astro_func
 
 
 # ignore astropy warning that Date after 2020-12-30 is "dubious"
@@ -34,12 +35,38 @@ R2D = 180. / math.pi #radians to degrees
 PI2 = 2. * math.pi   # 2 pi
 unit_limit = lambda x: min(max(-1.,x),1.) # forces value to be in [-1,1]
 
+NRCALL_FULL_V2IdlYang = -0.0265
+NRS_FULL_MSA_V3IdlYang = 137.4874
+NIS_V3IdlYang = -0.57
+MIRIM_FULL_V3IdlYang = 5.0152
+FGS1_FULL_V3IdlYang = -1.2508
+INSTRUMENT_PA_OFFSETS = (('NIRCam', NRCALL_FULL_V2IdlYang), ('NIRSpec', NRS_FULL_MSA_V3IdlYang),
+                         ('NIRISS', NIS_V3IdlYang), ('MIRI', MIRIM_FULL_V3IdlYang), ('FGS', FGS1_FULL_V3IdlYang))
+
+_pyplot_lock = threading.Lock()
+
+def _pyplot():
+    """Returns matplotlib.pyplot, selecting the plotting backend on first use.
+
+    pyplot is only imported when a plot is made, so the visibility
+    computations never touch the global backend state and can run headless
+    or from worker threads."""
+    with _pyplot_lock:
+        if 'matplotlib.pyplot' not in sys.modules:
+            import matplotlib
+            # Use TkAgg backend by default, but don't change backend if called from a Jupyter notebook with inline plots
+            if 'module://ipykernel.pylab.backend_inline' not in matplotlib.rcParams['backend']:
+                matplotlib.use('TkAgg')
+        import matplotlib.pyplot as plt
+    return plt
+
 def convert_ddmmss_to_float(astring):
-    aline = astring.split(':')
-    d= float(aline[0])
+    aline = astring.strip().split(':')
+    sign = -1. if aline[0].startswith('-') else 1.  # the sign applies to minutes and seconds too, e.g. -00:30:00
+    d= abs(float(aline[0]))
     m= float(aline[1])
     s= float(aline[2])
-    hour_or_deg = (s/60.+m)/60.+d
+    hour_or_deg = sign*((s/60.+m)/60.+d)
     return hour_or_deg
 
 def bound_angle(ang):
@@ -49,6 +76,17 @@ def bound_angle(ang):
         ang -= 360.
     return ang
 
+def bound_angle_many(ang):
+    """bound_angle() for an array of angles less than a turn away from [0, 360]."""
+    ang = np.where(ang < 0., ang + 360., ang)
+    return np.where(ang > 360., ang - 360., ang)
+
+def parse_coordinates(ra, dec):
+    """Fixed target coordinates, sexagesimal strings (hh:mm:ss.s dd:mm:ss.s) or degrees, in radians."""
+    if isinstance(ra, str) and ra.find(':')>-1:  #format is hh:mm:ss.s or  dd:mm:ss.s
+        return (convert_ddmmss_to_float(ra) * 15. * D2R, convert_ddmmss_to_float(dec) * D2R)
+    return (float(ra) * D2R, float(dec) * D2R)
+
 def angular_sep(obj1_c1,obj1_c2,obj2_c1,obj2_c2):
     """angular distance betrween two objects, positions specified in spherical coordinates."""
     x = math.cos(obj2_c2)*math.cos(obj1_c2)*math.cos(obj2_c1-obj1_c1) + math.sin(obj2_c2)*math.sin(obj1_c2)
@@ -61,6 +99,12 @@ def calc_ecliptic_lat(ra, dec):
     ecl_lat = math.pi/2. - a_sep
     return ecl_lat
 
+def calc_ecliptic_lat_many(ra, dec):
+    """calc_ecliptic_lat() for arrays of coordinates, in radians."""
+    NEP_ra = 270.000000 * D2R
+    NEP_dec = 66.560708 * D2R
+    return math.pi/2. - astro_func.dist_many(ra, dec, NEP_ra, NEP_dec)
+
 def sun_pitch(aV):
     return math.atan2(aV.x,-aV.z)
 
@@ -88,11 +132,61 @@ def allowed_max_vehicle_roll(sun_ra, sun_dec, ra, dec):
     max_vehicle_roll = math.asin(unit_limit(math.sin(sun_roll)/math.cos(vehicle_pitch)))
     return max_vehicle_roll
 
-def get_target_ephemeris(desg, start_date, end_date, smallbody=False):
+MAX_ROLL_TABLE_STEP = 0.01 * D2R  # separation step of the max vehicle roll table
+_max_roll_table = None
+_max_roll_table_lock = threading.Lock()
+
+def max_vehicle_roll_table():
+    """Returns (separations, max vehicle rolls), in radians, sampled over the field of regard.
+
+    allowed_max_vehicle_roll() depends only on the Sun-target separation, so it
+    is tabulated once on [MIN_SUN_ANGLE, MAX_SUN_ANGLE] every MAX_ROLL_TABLE_STEP.
+    Linear interpolation in the table stays within 6e-5 deg of the iterative
+    solver, below the 1e-4 deg to which the solver itself converges."""
+    global _max_roll_table
+    with _max_roll_table_lock:
+        if _max_roll_table is None:
+            n = int(round((EPH.MAX_SUN_ANGLE - EPH.MIN_SUN_ANGLE)/MAX_ROLL_TABLE_STEP)) + 1
+            seps = np.linspace(EPH.MIN_SUN_ANGLE, EPH.MAX_SUN_ANGLE, n)
+            rolls = np.array([allowed_max_vehicle_roll(0., 0., sep, 0.) for sep in seps])
+            seps.setflags(write=False)
+            rolls.setflags(write=False)
+            _max_roll_table = (seps, rolls)
+    return _max_roll_table
+
+def max_vehicle_roll_from_sep(sep):
+    """Max vehicle roll (radians) for an array of Sun-target separations (radians).
+
+    Interpolated in max_vehicle_roll_table(); separations outside the field of
+    regard, where no attitude is allowed, give NaN."""
+    (seps, rolls) = max_vehicle_roll_table()
+    return np.interp(sep, seps, rolls, left=np.nan, right=np.nan)
+
+def allowed_max_vehicle_roll_many(sun_ra, sun_dec, ra, dec):
+    """allowed_max_vehicle_roll() for numpy arrays, through the lookup table."""
+    return max_vehicle_roll_from_sep(astro_func.dist_many(sun_ra, sun_dec, ra, dec))
+
+def _check_step(step):
+    """Raises ValueError unless step, in days, is positive."""
+    if not step > 0.:
+        raise ValueError('Step should be a positive number of days, got {}'.format(step))
+
+def horizons_step(step):
+    """JPL/HORIZONS step size for a step in days, in whole days, hours or minutes."""
+    _check_step(step)
+    for (unit, per_day) in (('d', 1.), ('h', 24.)):
+        count = step * per_day
+        if count >= 1. and abs(count - round(count)) < 1e-6:
+            return '{}{}'.format(int(round(count)), unit)
+    return '{}m'.format(max(int(round(step * 1440.)), 1))
+
+def get_target_ephemeris(desg, start_date, end_date, smallbody=False, step=1.):
     """Ephemeris from JPL/HORIZONS.
     smallbody : bool, optional
       Set to `True` for comets and asteroids, `False` for planets,
       spacecraft, or moons.
+    step : float, optional
+      Days between epochs, which must match the step given to main().
     Returns : target name from HORIZONS, RA, and Dec.
     """
 
@@ -103,20 +197,121 @@ def get_target_ephemeris(desg, start_date, end_date, smallbody=False):
 
     obj = Horizons(id=desg, location='500@-170', id_type=bodytype,
                    epochs={'start':start_date, 'stop':end_date,
-                   'step':'1d'})
+                   'step':horizons_step(step)})
 
     eph = obj.ephemerides(cache=False, quantities=(1))
 
     return eph['targetname'][0], eph['RA'], eph['DEC']
 
 
+def time_grid(start, span, step=1.):
+    """Dates (MJD) every step days from start over span days, on which the windows are searched."""
+    _check_step(step)
+    return start + np.arange(int(span/step + 1e-9) + 1) * float(step)
+
+def date_labels(dates, step=1.):
+    """ISO dates, with hours and minutes for steps that are not whole days."""
+    labels = Time(dates, format='mjd')
+    labels.format = 'isot'
+    labels.out_subfmt = 'date' if step >= 1. and float(step).is_integer() else 'date_hm'
+    return labels.value
+
+def pa_table(A_eph, dates, ra, dec):
+    """ V3 and instrument position angle ranges of a target over an array of dates.
+
+    ra and dec are arrays of radians matching dates.  Returns (flags, tab):
+    the field of regard state on each date and a Table with the columns of
+    get_table() but 'Date', in degrees.  All columns are filled in place in
+    one preallocated array and are NaN out of the field of regard.
+    """
+    names = ['V3PA', 'V3PA min', 'V3PA max']
+    for (instrument, offset) in INSTRUMENT_PA_OFFSETS:
+        names += [instrument + ' nom', instrument + ' min', instrument + ' max']
+    values = np.full((len(names), len(dates)), np.nan)
+    flags = A_eph.in_FOR_many(dates, ra, dec) if len(dates) else np.zeros(0, dtype=bool)
+    k = np.flatnonzero(flags)
+    if len(k):
+        V3PA = A_eph.normal_pa_many(dates[k], ra[k], dec[k]) * R2D
+        (sun_ra, sun_dec) = A_eph.sun_pos_many(dates[k])
+        max_boresight_roll = allowed_max_vehicle_roll_many(sun_ra, sun_dec, ra[k], dec[k]) * R2D
+        values[0, k] = V3PA
+        values[1, k] = bound_angle_many(V3PA - max_boresight_roll)
+        values[2, k] = bound_angle_many(V3PA + max_boresight_roll)
+        for (i, (instrument, offset)) in enumerate(INSTRUMENT_PA_OFFSETS):
+            values[3*i + 3, k] = bound_angle_many(V3PA + offset)
+            values[3*i + 4, k] = bound_angle_many(V3PA - max_boresight_roll + offset)
+            values[3*i + 5, k] = bound_angle_many(V3PA + max_boresight_roll + offset)
+    return (flags, Table(list(values), names=names, copy=False))
+
+SCREEN_MARGIN = 0.01 * D2R  # margin of screen_targets() on the Sun separation bounds
+
+def screen_targets(A_eph, ra, dec, start, end):
+    """ Closed-form field of regard classification of fixed targets between start and end (MJD).
+
+    The Sun stays within a small envelope of ecliptic latitudes, measured
+    with calc_ecliptic_lat over the interval.  By the triangle inequality
+    the Sun separation of a target is then within that envelope of its
+    separation to the point of the ecliptic at the Sun's longitude, which
+    only depends on the target's ecliptic latitude and its longitude
+    difference to the Sun.  The extremes of the latter over the arc swept
+    by the Sun bound the separation over the whole interval without
+    stepping through it.  ra and dec are equatorial, in radians, and the
+    ephemeris must be the equatorial one.
+
+    Returns (cvz, never): boolean arrays flagging the targets certainly in
+    the field of regard throughout the interval and those certainly never
+    in it.  Others need a scan, as do targets close to either case.
+    """
+    ra = np.atleast_1d(np.asarray(ra, dtype=np.float64))
+    dec = np.atleast_1d(np.asarray(dec, dtype=np.float64))
+    ecl_lat = calc_ecliptic_lat_many(ra, dec)
+    vectors = np.column_stack((np.cos(dec)*np.cos(ra), np.cos(dec)*np.sin(ra), np.sin(dec))).dot(EPH.Meci2ecl.T)
+    ecl_lon = np.arctan2(vectors[:, 1], vectors[:, 0])
+
+    #Arc of ecliptic longitudes swept by the Sun, and its latitude envelope.
+    sun_dates = np.linspace(start, end, int(end - start) + 2)
+    sun = A_eph.sun_unit_vectors(sun_dates).dot(EPH.Meci2ecl.T)
+    sun_lon = np.unwrap(np.arctan2(sun[:, 1], sun[:, 0]))
+    (sun_ra, sun_dec) = A_eph.sun_pos_many(sun_dates)
+    envelope = np.abs(calc_ecliptic_lat_many(sun_ra, sun_dec)).max() + SCREEN_MARGIN
+    arc = sun_lon[-1] - sun_lon[0]
+
+    #Smallest and largest longitude differences to the Sun over the arc.
+    x = np.mod(ecl_lon - sun_lon[0], PI2)
+    near = np.where(x <= arc, 0., np.minimum(x - arc, PI2 - x))
+    y = np.mod(ecl_lon + math.pi - sun_lon[0], PI2)
+    far = np.where(y <= arc, math.pi, math.pi - np.minimum(y - arc, PI2 - y))
+    min_sep = np.arccos(np.clip(np.cos(ecl_lat)*np.cos(near), -1., 1.)) - envelope
+    max_sep = np.arccos(np.clip(np.cos(ecl_lat)*np.cos(far), -1., 1.)) + envelope
+
+    cvz = (min_sep >= EPH.MIN_SUN_ANGLE) & (max_sep <= EPH.MAX_SUN_ANGLE)
+    never = (max_sep < EPH.MIN_SUN_ANGLE) | (min_sep > EPH.MAX_SUN_ANGLE)
+    return (cvz, never)
+
+def search_interval(A_eph, start_date=None, end_date=None):
+    """Checks the requested search dates against the ephemeris coverage.
+
+    Returns (start, end) in MJD; missing dates default to the limits of the ephemeris."""
+    (ephem_start, ephem_end) = A_eph.coverage
+    search_start = Time(start_date, format='iso').mjd if start_date is not None else ephem_start
+    search_end = Time(end_date, format='iso').mjd if end_date is not None else ephem_end
+
+    coverage = lambda: tuple(Time(mjd, format='mjd').isot[:10] for mjd in (ephem_start, ephem_end))
+    if not (ephem_start <= search_start <= ephem_end) and start_date is not None:
+        raise ValueError('Start date {} outside of available ephemeris {} to {}'.format(start_date, *coverage()))
+    if not (ephem_start <= search_end <= ephem_end) and end_date is not None:
+        raise ValueError('End date {} outside of available ephemeris {} to {}'.format(end_date, *coverage()))
+    if search_start > search_end:
+        raise ValueError('Start date {} should be before end date {}'.format(start_date, end_date))
+    return (search_start, search_end)
+
 def window_summary_line(fixed, wstart, wend, pa_start, pa_end, ra_start, ra_end, dec_start, dec_end, cvz=False):
     """Formats window summary data for fixed and moving targets."""
     if cvz:
         line = " {0:15} {0:11} {0:11} ".format('CVZ')
     else:
-        line = " {:15} {:11} {:11.2f} ".format(Time(wstart, format='mjd', out_subfmt='date').isot,
-                                               Time(wend, format='mjd', out_subfmt='date').isot,wend-wstart)
+        line = " {:15} {:11} {:11.2f} ".format(Time(wstart, format='mjd').isot[:10],
+                                               Time(wend, format='mjd').isot[:10],wend-wstart)
     line += "{:13.5f} {:13.5f} ".format(pa_start*R2D,pa_end*R2D)
     if fixed:
         line += "{:13.5f} {:13.5f} ".format(ra_start*R2D, dec_start*R2D)
@@ -125,400 +320,422 @@ def window_summary_line(fixed, wstart, wend, pa_start, pa_end, ra_start, ra_end,
 
     return line
 
-def main(args, fixed=True):
+def scan_windows(A_eph, dates, ra, dec, pa="X", tol=EPH.BISECT_TOLERANCE):
+    """Finds the visibility windows of a target over a grid of dates.
 
-    table_output=None
-    if args.save_table is not None:
-        table_output = open(args.save_table, 'w')
+    ra and dec are arrays matching dates.  With pa == "X" windows are
+    periods in the field of regard, otherwise periods where the V3 position
+    angle pa (radians) is a valid attitude.  The in/out state of every grid
+    date is computed in one go; only the transitions, taken from the
+    changes of that mask, are refined, all together, by bisection to tol days
+    between the grid dates on either side.
 
-    NRCALL_FULL_V2IdlYang = -0.0265
-    NRS_FULL_MSA_V3IdlYang = 137.4874
-    NIS_V3IdlYang = -0.57
-    MIRIM_FULL_V3IdlYang = 5.0152
-    FGS1_FULL_V3IdlYang = -1.2508
+    Returns (windows, cvz): windows is a list of
+    (wstart, wend, pa_start, pa_end, ra_start, ra_end, dec_start, dec_end)
+    tuples and cvz is True if the target never leaves the field of regard."""
+    if pa == "X":
+        flags = A_eph.in_FOR_many(dates, ra, dec)
+    else:
+        flags = A_eph.is_valid_many(dates, ra, dec, pa)
 
-    ECL_FLAG = False
+    windows = []
+    if flags[0]:
+      twstart = dates[0]
+      ra_start = ra[0]
+      dec_start = dec[0]
+    else:
+      twstart = -1.
+    transitions = np.flatnonzero(flags[1:] != flags[:-1]) + 1
+    entering = flags[transitions]
+    #Each transition is bracketed by the grid dates on either side of it.
+    in_dates = np.where(entering, dates[transitions], dates[transitions-1])
+    out_dates = np.where(entering, dates[transitions-1], dates[transitions])
+    edges = A_eph.bisect_many(in_dates, out_dates, ra[transitions], dec[transitions],
+                              None if pa == "X" else pa, tol=tol)
+    for (i, edge) in zip(transitions, edges.tolist()):
+        if flags[i]:
+            twstart = edge
+            ra_start = ra[i]
+            dec_start = dec[i]
+        else:
+            wend = edge
+            if twstart > 0.:
+                wstart = twstart #Only set wstart if wend is valid
+                if pa == "X":
+                    pa_start = A_eph.normal_pa(wstart,ra_start,dec_start)
+                    pa_end   = A_eph.normal_pa(wend,ra[i],dec[i])
+                else:
+                    pa_start = pa
+                    pa_end = pa
+                windows.append((wstart, wend, pa_start, pa_end, ra_start, ra[i], dec_start, dec[i]))
 
-    A_eph = EPH.Ephemeris(join(dirname(abspath(__file__)), "horizons_EM_jwst_wrt_sun_2020-2024.txt"),ECL_FLAG, verbose=args.no_verbose)
+    i = len(dates) - 1
+    if len(transitions) and flags[i]:
+        adate = dates[i]
+        if pa == "X":
+            pa_start = A_eph.normal_pa(twstart,ra[i],dec[i])
+            pa_end   = A_eph.normal_pa(adate,ra[i],dec[i])
+        else:
+            pa_start = pa
+            pa_end = pa
+        windows.append((twstart, adate, pa_start, pa_end, ra[i], ra[i], dec[i], dec[i]))
+
+    cvz = not len(transitions) and bool(flags[i]) and pa == "X"
+    return (windows, cvz)
+
+def fixed_target_windows(A_eph, dates, ra, dec, tol=EPH.BISECT_TOLERANCE):
+    """scan_windows() for the field of regard of a fixed target at (ra, dec), in radians.
+
+    The windows between the first and last of dates are solved for with the
+    ephemeris' SunLongitudeMap instead of stepping through the dates; only
+    targets close to a tangency of the separation limits are stepped through,
+    with adaptive_windows_many()."""
+    (tgt, wstart, wend, cvz, fallback) = A_eph.sun_longitude_map().windows(ra, dec, dates[0], dates[-1], tol)
+    if fallback[0]:
+        (tgt, wstart, wend, cvz) = adaptive_windows_many(A_eph, dates[0], dates[-1], np.array([ra]), np.array([dec]), tol)
+    windows = [(start, end, A_eph.normal_pa(start,ra,dec), A_eph.normal_pa(end,ra,dec), ra, ra, dec, dec)
+               for (start, end) in zip(wstart.tolist(), wend.tolist())]
+    return (windows, bool(cvz[0]))
+
+def target_windows(A_eph, dates, ra, dec, pa="X", tol=EPH.BISECT_TOLERANCE, fixed=True):
+    """Visibility windows of main() and get_table(), as returned by scan_windows().
+
+    Fixed targets are screened first with screen_targets(): CVZ and never
+    visible ones need no further work, field of regard windows of others
+    are solved for with fixed_target_windows().  Moving targets, and fixed
+    ones with a pa, are scanned."""
+    if fixed:
+        (cvz, never) = screen_targets(A_eph, ra[:1], dec[:1], dates[0], dates[-1])
+        if never[0] or (cvz[0] and pa == "X"):
+            return ([], bool(cvz[0]) and pa == "X")
+        if pa == "X":
+            return fixed_target_windows(A_eph, dates, ra[0], dec[0], tol)
+    return scan_windows(A_eph, dates, ra, dec, pa, tol)
 
-    search_start = Time(args.start_date, format='iso').mjd if args.start_date is not None else 58849.0  #Jan 1, 2020
-    search_end = Time(args.end_date, format='iso').mjd if args.end_date is not None else 60309.0 # Dec 31, 2023
+MAIN_TABLE_COLUMNS = ('V3PA min', 'V3PA max', 'NIRCam min', 'NIRCam max', 'NIRSpec min', 'NIRSpec max',
+                      'NIRISS min', 'NIRISS max', 'MIRI min', 'MIRI max', 'FGS min', 'FGS max')  # PA table of main()
 
-    if not (58849.0 <= search_start <= 60309.0) and args.start_date is not None:
-        raise ValueError('Start date {} outside of available ephemeris {} to {}'.format(args.start_date, '2020-01-01', '2023-12-31'))
-    if not (58849.0 <= search_end <= 60309.0) and args.end_date is not None:
-        raise ValueError('End date {} outside of available ephemeris {} to {}'.format(args.end_date, '2020-01-01', '2023-12-31'))
-    if search_start > search_end:
-        raise ValueError('Start date {} should be before end date {}'.format(args.start_date, args.end_date))
+class TargetVisibility(object):
+    """ Visibility of one target as computed by compute_target(), free of any formatting.
 
-    if search_start < A_eph.amin:
-        print("Warning, search start time is earlier than ephemeris start.", file=table_output)
-        search_start = A_eph.amin + 1
+    Renderers turn it into text (print_visibility), an astropy Table
+    (visibility_table) or plots (plot_visibility), only when asked for.
 
-    scale = 1  # Channging this value must be reflected in get_target_ephemeris
-    span = int(search_end-search_start)
+    Attributes
+    ----------
+    ephemeris : Ephemeris
+        The ephemeris the target was computed with.
+    fixed : bool
+        Whether or not the target is fixed.
+    coords : tuple
+        (ra, dec) as given to compute_target.
+    pa : str or float
+        V3 PA of the windows in radians, "X" for field of regard windows.
+    search_start, search_end : float
+        Search interval (MJD).  start_clipped is set if the start had to be
+        moved into the ephemeris.
+    span, step : float
+        Length of the checked interval in whole days, and days between dates.
+    dates, ra, dec : array
+        Grid of dates searched (MJD) and the target coordinates on it (radians).
+    windows, cvz : list, bool
+        As returned by scan_windows().
+    days, rows, flags : array
+        Dates of the PA table (MJD), the searched dates before the end,
+        their index in dates, ra and dec, and whether the target is in the
+        field of regard on each.
+    pa_ranges : astropy.table Table
+        The position angle columns of pa_table() for days, in degrees.
+    in_at_start : bool
+        Whether the target is in the field of regard at search_start.
+
+    The PA table attributes, from days to in_at_start, are None when only
+    the windows were computed.
+    """
 
+    def __init__(self, ephemeris, fixed, coords, pa, search_start, search_end, start_clipped, span, step,
+                 dates, ra, dec, windows, cvz, days=None, rows=None, flags=None, pa_ranges=None, in_at_start=None):
+        self.ephemeris = ephemeris
+        self.fixed = fixed
+        self.coords = coords
+        self.pa = pa
+        self.search_start = search_start
+        self.search_end = search_end
+        self.start_clipped = start_clipped
+        self.span = span
+        self.step = step
+        self.dates = dates
+        self.ra = ra
+        self.dec = dec
+        self.windows = windows
+        self.cvz = cvz
+        self.days = days
+        self.rows = rows
+        self.flags = flags
+        self.pa_ranges = pa_ranges
+        self.in_at_start = in_at_start
+
+def compute_target(ra, dec, start_date=None, end_date=None, v3pa=None, fixed=True, tolerance=EPH.BISECT_TOLERANCE,
+                   step=1., verbose=False, pa_ranges=True, A_eph=None):
+    """ Computes the windows and PA table of main() and get_table() into a TargetVisibility.
+
+    ra and dec are as in get_windows().  Nothing is printed, formatted or
+    plotted and no Time objects are created; verbose is passed on to
+    get_ephemeris.  Without pa_ranges only the windows are computed and
+    the PA table attributes are None.  A_eph defaults to the shared
+    equatorial Ephemeris of DEFAULT_EPHEMERIS.
+    """
+    if A_eph is None:
+        A_eph = EPH.get_ephemeris(EPH.DEFAULT_EPHEMERIS, False, verbose=verbose)
+    coords = (ra, dec)
 
-    # if len(sys.argv) < 3:
-    #   print "proper usage:"
-    #   print "find_tgt_info.py ra dec [pa]"
-    #   print "finds full visibility windows over [{}, {}]".format(Time(search_start, format='mjd', out_subfmt='date').isot,
-    #     Time(search_start+span/scale, format='mjd', out_subfmt='date').isot)
-    #   sys.exit(1)
+    (search_start, search_end) = search_interval(A_eph, start_date, end_date)
+    start_clipped = search_start < A_eph.amin
+    if start_clipped:
+        search_start = A_eph.amin + 1
 
+    span = int(search_end-search_start)
+    dates = time_grid(search_start, span, step)  # moving targets are sampled with the same step
+    A_eph.sun_table(dates)
 
-    pa = 'X'
     if fixed:
-        if args.ra.find(':')>-1:  #format is hh:mm:ss.s or  dd:mm:ss.s
-          ra  = convert_ddmmss_to_float(args.ra) * 15. * D2R
-          dec   = convert_ddmmss_to_float(args.dec) * D2R
-        else: #format is decimal
-          ra  = float(args.ra) * D2R
-          dec   = float(args.dec) * D2R
-
+        (ra, dec) = parse_coordinates(ra, dec)
         # although the coordinates are fixed, we need an array for
         # symmetry with moving target ephemerides
-        ra = np.repeat(ra, span * scale + 1)
-        dec = np.repeat(dec, span * scale + 1)
+        ra = np.repeat(ra, len(dates))
+        dec = np.repeat(dec, len(dates))
     else:
-        assert len(args.ra) == span * scale + 1, "{} epochs retrieved for the moving target, but {} expected.".format(len(args.ra), span * scale + 1)
-        ra = args.ra * D2R
-        dec = args.dec * D2R
-
-    if not args.no_verbose:
-        print("", file=table_output)
-        print("       Target", file=table_output)
+        assert len(ra) == len(dates), "{} epochs retrieved for the moving target, but {} expected.".format(len(ra), len(dates))
+        ra = np.asarray(ra, dtype=np.float64) * D2R
+        dec = np.asarray(dec, dtype=np.float64) * D2R
+    pa = "X" if v3pa is None else float(v3pa) * D2R
+
+    (windows, cvz) = target_windows(A_eph, dates, ra, dec, pa, tolerance, fixed)
+
+    table = {}
+    if pa_ranges:
+        # The rows are the searched dates before the end, so their Sun positions come from the same SunTable
+        rows = np.arange(min(int(ceil(span/float(step) - 1e-9)), len(dates)))
+        days = dates[rows]
+        (flags, ranges) = pa_table(A_eph, days, ra[rows], dec[rows])
+        table = dict(days=days, rows=rows, flags=flags, pa_ranges=ranges,
+                     in_at_start=A_eph.in_FOR(search_start, ra[0], dec[0]))
+    return TargetVisibility(A_eph, fixed, coords, pa, search_start, search_end, start_clipped, span, step,
+                            dates, ra, dec, windows, cvz, **table)
+
+def print_visibility(result, table_output=None, columns=MAIN_TABLE_COLUMNS):
+    """Text renderer: prints the target, its windows and the PA table columns of a TargetVisibility."""
+    (fixed, ra, dec) = (result.fixed, result.ra, result.dec)
+    print("", file=table_output)
+    print("       Target", file=table_output)
     if fixed:
-        if not args.no_verbose:
-            print("                ecliptic", file=table_output)
-            print("RA      Dec     latitude", file=table_output)
-            print("%7.3f %7.3f %7.3f" % (ra[0]*R2D,dec[0]*R2D,calc_ecliptic_lat(ra[0], dec[0])*R2D), file=table_output)
-
-    if not args.no_verbose:
-        print("", file=table_output)
-
-    if args.v3pa is not None:
-        pa     = float(args.v3pa) * D2R
-    if not args.no_verbose:
-        print("Checked interval [{}, {}]".format(Time(search_start, format='mjd', out_subfmt='date').isot,
-            Time(search_start+span, format='mjd', out_subfmt='date').isot), file=table_output)
-    if pa == "X":
-        iflag_old = A_eph.in_FOR(search_start,ra[0],dec[0])
-        if not args.no_verbose:
-            print("|           Window [days]                 |    Normal V3 PA [deg]    |", end='', file=table_output)
+        print("                ecliptic", file=table_output)
+        print("RA      Dec     latitude", file=table_output)
+        print("%7.3f %7.3f %7.3f" % (ra[0]*R2D,dec[0]*R2D,calc_ecliptic_lat(ra[0], dec[0])*R2D), file=table_output)
+    print("", file=table_output)
+
+    print("Checked interval [{}, {}]".format(Time(result.search_start, format='mjd').isot[:10],
+        Time(result.search_start+result.span, format='mjd').isot[:10]), file=table_output)
+    if result.pa == "X":
+        print("|           Window [days]                 |    Normal V3 PA [deg]    |", end='', file=table_output)
     else:
-        iflag_old = A_eph.is_valid(search_start,ra[0],dec[0],pa)
-        if not args.no_verbose:
-            print("|           Window [days]                 |   Specified V3 PA [deg]  |", end='', file=table_output)
-
+        print("|           Window [days]                 |   Specified V3 PA [deg]  |", end='', file=table_output)
     if fixed:
-        if not args.no_verbose:
-            print('\n', end='', file=table_output)
+        print('\n', end='', file=table_output)
     else:
-        if not args.no_verbose:
-            print('{:^27s}|{:^27s}|'.format('RA', 'Dec'), file=table_output)
-
-    if not args.no_verbose:
-        print("   Start           End         Duration         Start         End    ", end='', file=table_output)
+        print('{:^27s}|{:^27s}|'.format('RA', 'Dec'), file=table_output)
+    print("   Start           End         Duration         Start         End    ", end='', file=table_output)
     if fixed:
-        if not args.no_verbose:
-            print("{:^13s} {:^13s}".format('RA', 'Dec'), file=table_output)
+        print("{:^13s} {:^13s}".format('RA', 'Dec'), file=table_output)
     else:
-        if not args.no_verbose:
-            print("{:^13s} {:^13s} {:^13s} {:^13s}".format('Start', 'End', 'Start', 'End'), file=table_output)
+        print("{:^13s} {:^13s} {:^13s} {:^13s}".format('Start', 'End', 'Start', 'End'), file=table_output)
 
-    if iflag_old:
-      twstart = search_start
-      ra_start = ra[0]
-      dec_start = dec[0]
-    else:
-      twstart = -1.
-    iflip = False
-
-    #Step througth the interval and find where target goes in/out of field of regard.
-    for i in range(1,span*scale+1):
-        adate = search_start + float(i)/float(scale)
-        #iflag = A_eph.in_FOR(adate,ra,dec)
-        if pa == "X":
-            iflag = A_eph.in_FOR(adate,ra[i],dec[i])
+    for window in result.windows:
+        print(window_summary_line(fixed, *window), file=table_output)
+    if result.cvz:
+        if dec[-1] >0.:
+            print(window_summary_line(fixed, 0, 0, 2 * np.pi, 0, ra[0], ra[-1], dec[0], dec[-1], cvz=True), file=table_output)
         else:
-            iflag = A_eph.is_valid(adate,ra[i],dec[i],pa)
-        if iflag != iflag_old:
-            iflip = True
-            if iflag:
-                if pa == "X":
-                    twstart = A_eph.bisect_by_FOR(adate,adate-0.1,ra[i],dec[i])
-                else:
-                    twstart = A_eph.bisect_by_attitude(adate,adate-0.1,ra[i],dec[i],pa)
-                ra_start = ra[i]
-                dec_start = dec[i]
+            print(window_summary_line(fixed, 0, 0, 0, 2 * np.pi, ra[0], ra[-1], dec[0], dec[-1], cvz=True), file=table_output)
+
+    print("", file=table_output)
+    print("", file=table_output)
+    if fixed:
+        fmt_repeats = 6
+        print("                V3PA          NIRCam           NIRSpec         NIRISS           MIRI          FGS", file=table_output)
+        print("   Date      min    max      min    max       min    max     min    max      min    max      min    max", file=table_output)
+            #58849.0 264.83 275.18 264.80 264.80  42.32  42.32 264.26 264.26 269.84 269.84 263.58 263.58
+    else:
+        fmt_repeats = 7
+        print("                                V3PA          NIRCam           NIRSpec         NIRISS           MIRI          FGS", file=table_output)
+        print("   Date      RA     Dec      min    max      min    max       min    max     min    max      min    max      min    max", file=table_output)
+
+    tgt_is_in = result.in_at_start
+    fmt = '{}' + '   {:6.2f} {:6.2f}'*fmt_repeats
+    values = np.array([result.pa_ranges[name] for name in columns]).T.tolist()
+    for (label, i, iflag, row) in zip(date_labels(result.days, result.step), result.rows.tolist(),
+                                      result.flags.tolist(), values):
+        if iflag:
+            if not tgt_is_in:
+                print("", file=table_output)
+            tgt_is_in = True
+            if fixed:
+                print(fmt.format(label, *row), file=table_output)
             else:
-                if pa == "X":
-                    wend = A_eph.bisect_by_FOR(adate-0.1,adate,ra[i],dec[i])
-                else:
-                    wend = A_eph.bisect_by_attitude(adate-0.1,adate,ra[i],dec[i],pa)
-                if twstart > 0.:
-                    wstart = twstart #Only set wstart if wend is valid
-                    if pa == "X":
-                        pa_start = A_eph.normal_pa(wstart,ra_start,dec_start)
-                        pa_end   = A_eph.normal_pa(wend,ra[i],dec[i])
-                    else:
-                        pa_start = pa
-                        pa_end = pa
-                    ra_end = ra[i]
-                    dec_end = dec[i]
-                    if not args.no_verbose:
-                        print(window_summary_line(fixed, wstart, wend, pa_start, pa_end, ra_start, ra_end, dec_start, dec_end), file=table_output)
-            iflag_old = iflag
-
-    if iflip == True and iflag == True:
-        if pa == "X":
-            pa_start = A_eph.normal_pa(twstart,ra[i],dec[i])
-            pa_end   = A_eph.normal_pa(adate,ra[i],dec[i])
+                print(fmt.format(label, ra[i]*R2D, dec[i]*R2D, *row), file=table_output)
         else:
-            pa_start = pa
-            pa_end = pa
-        if not args.no_verbose:
-            print(window_summary_line(fixed, twstart, adate, pa_start, pa_end, ra[i], ra[i], dec[i], dec[i]), file=table_output)
+            tgt_is_in = False
 
-    if iflip == False and iflag == True and pa == "X":
-        if dec[i] >0.:
-            if not args.no_verbose:
-                print(window_summary_line(fixed, 0, 0, 2 * np.pi, 0, ra[0], ra[-1], dec[0], dec[-1], cvz=True), file=table_output)
-        else:
-            if not args.no_verbose:
-                print(window_summary_line(fixed, 0, 0, 0, 2 * np.pi, ra[0], ra[-1], dec[0], dec[-1], cvz=True), file=table_output)
-
-    if 1==1:
-        wstart = search_start
-        wend = wstart + span
-        istart = int(wstart)
-        iend = int(wend)
-        iflag = A_eph.in_FOR(wstart,ra[0],dec[0])
-        tgt_is_in = False
-        if iflag:
-          tgt_is_in = True
+def visibility_table(result, columns=None):
+    """Table renderer: the 'Date' and PA columns (default all) of a TargetVisibility as an astropy Table."""
+    tab = result.pa_ranges if columns is None else result.pa_ranges[list(columns)]
+    tab = Table(tab, copy=False)
+    tab.add_column(Time(result.days, format='mjd').datetime, name='Date', index=0)
+    return tab
 
-        if not args.no_verbose:
-            print("", file=table_output)
-            print("", file=table_output)
-
-        if fixed:
-            fmt_repeats = 6
-            if not args.no_verbose:
-                print("                V3PA          NIRCam           NIRSpec         NIRISS           MIRI          FGS", file=table_output)
-                print("   Date      min    max      min    max       min    max     min    max      min    max      min    max", file=table_output)
-                    #58849.0 264.83 275.18 264.80 264.80  42.32  42.32 264.26 264.26 269.84 269.84 263.58 263.58
-        else:
-            fmt_repeats = 7
-            if not args.no_verbose:
-                print("                                V3PA          NIRCam           NIRSpec         NIRISS           MIRI          FGS", file=table_output)
-                print("   Date      RA     Dec      min    max      min    max       min    max     min    max      min    max      min    max", file=table_output)
-        
-        times = []
-        minV3PA_data = []
-        maxV3PA_data = []
-        minNIRCam_PA_data = []
-        maxNIRCam_PA_data = []
-        minNIRSpec_PA_data = []
-        maxNIRSpec_PA_data = []
-        minNIRISS_PA_data = []
-        maxNIRISS_PA_data = []
-        minMIRI_PA_data = []
-        maxMIRI_PA_data = []
-        minFGS_PA_data = []
-        maxFGS_PA_data = []
-
-        for itime in range(istart,iend):
-            atime = float(itime)
-            i = int((atime - search_start) * float(scale))
-            iflag = A_eph.in_FOR(atime,ra[i],dec[i])
-            #print atime,A_eph.in_FOR(atime,ra,dec)
-            if iflag:
-                if not tgt_is_in:
-                    if not args.no_verbose:
-                        print("", file=table_output)
-                tgt_is_in = True
-
-                V3PA = A_eph.normal_pa(atime,ra[i],dec[i])*R2D
-                (sun_ra, sun_dec) = A_eph.sun_pos(atime)
-                max_boresight_roll = allowed_max_vehicle_roll(sun_ra, sun_dec, ra[i], dec[i]) * R2D
-                #sun_ang = angular_sep(sun_ra, sun_dec, ra, dec) * R2D
-
-                minV3PA = bound_angle(V3PA - max_boresight_roll)
-                maxV3PA = bound_angle(V3PA + max_boresight_roll)
-                minNIRCam_PA = bound_angle(V3PA - max_boresight_roll + NRCALL_FULL_V2IdlYang)
-                maxNIRCam_PA = bound_angle(V3PA + max_boresight_roll + NRCALL_FULL_V2IdlYang)
-                minNIRSpec_PA = bound_angle(V3PA - max_boresight_roll + NRS_FULL_MSA_V3IdlYang)
-                maxNIRSpec_PA = bound_angle(V3PA + max_boresight_roll + NRS_FULL_MSA_V3IdlYang)
-                minNIRISS_PA = bound_angle(V3PA - max_boresight_roll + NIS_V3IdlYang)
-                maxNIRISS_PA = bound_angle(V3PA + max_boresight_roll + NIS_V3IdlYang)
-                minMIRI_PA = bound_angle(V3PA - max_boresight_roll + MIRIM_FULL_V3IdlYang)
-                maxMIRI_PA = bound_angle(V3PA + max_boresight_roll + MIRIM_FULL_V3IdlYang)
-                minFGS_PA = bound_angle(V3PA - max_boresight_roll + FGS1_FULL_V3IdlYang)
-                maxFGS_PA = bound_angle(V3PA + max_boresight_roll + FGS1_FULL_V3IdlYang)
-
-                times.append(Time(atime, format='mjd').datetime)
-                minV3PA_data.append(minV3PA)
-                maxV3PA_data.append(maxV3PA)
-                minNIRCam_PA_data.append(minNIRCam_PA)
-                maxNIRCam_PA_data.append(maxNIRCam_PA)
-                minNIRSpec_PA_data.append(minNIRSpec_PA)
-                maxNIRSpec_PA_data.append(maxNIRSpec_PA)
-                minNIRISS_PA_data.append(minNIRISS_PA)
-                maxNIRISS_PA_data.append(maxNIRISS_PA)
-                minMIRI_PA_data.append(minMIRI_PA)
-                maxMIRI_PA_data.append(maxMIRI_PA)
-                minFGS_PA_data.append(minFGS_PA)
-                maxFGS_PA_data.append(maxFGS_PA)
-                #print '%7.1f %6.2f %6.2f %6.2f' % (atime, V3PA, NIRCam_PA, NIRSpec_PA)
-                fmt = '{}' + '   {:6.2f} {:6.2f}'*fmt_repeats
-                if fixed:
-                    if not args.no_verbose:
-                        print(fmt.format(
-                            Time(atime, format='mjd', out_subfmt='date').isot, minV3PA, maxV3PA,
-                            minNIRCam_PA, maxNIRCam_PA, minNIRSpec_PA, maxNIRSpec_PA, minNIRISS_PA,
-                            maxNIRISS_PA, minMIRI_PA, maxMIRI_PA, minFGS_PA, maxFGS_PA), file=table_output)#,sun_ang
-                else:
-                    if not args.no_verbose:
-                        print(fmt.format(
-                            Time(atime, format='mjd', out_subfmt='date').isot, ra[i]*R2D, dec[i]*R2D, minV3PA, maxV3PA,
-                            minNIRCam_PA, maxNIRCam_PA, minNIRSpec_PA, maxNIRSpec_PA, minNIRISS_PA,
-                            maxNIRISS_PA, minMIRI_PA, maxMIRI_PA, minFGS_PA, maxFGS_PA), file=table_output)#,sun_ang
-            else:
-                tgt_is_in = False
-                times.append(Time(atime, format='mjd').datetime)
-                minV3PA_data.append(np.nan)
-                maxV3PA_data.append(np.nan)
-                minNIRCam_PA_data.append(np.nan)
-                maxNIRCam_PA_data.append(np.nan)
-                minNIRSpec_PA_data.append(np.nan)
-                maxNIRSpec_PA_data.append(np.nan)
-                minNIRISS_PA_data.append(np.nan)
-                maxNIRISS_PA_data.append(np.nan)
-                minMIRI_PA_data.append(np.nan)
-                maxMIRI_PA_data.append(np.nan)
-                minFGS_PA_data.append(np.nan)
-                maxFGS_PA_data.append(np.nan)
-
-        tab = Table([times, minV3PA_data, maxV3PA_data, minNIRCam_PA_data, maxNIRCam_PA_data,
-            minNIRSpec_PA_data, maxNIRSpec_PA_data, minNIRISS_PA_data, maxNIRISS_PA_data,
-            minMIRI_PA_data, maxMIRI_PA_data, minFGS_PA_data, maxFGS_PA_data],
-            names=('Date', 'V3PA min', 'V3PA max', 'NIRCam min', 'NIRCam max',
-                'NIRSpec min', 'NIRSpec max', 'NIRISS min', 'NIRISS max',
-                'MIRI min', 'MIRI max', 'FGS min', 'FGS max'))
-
-        # Plot observing windows
-        if args.instrument is None:
-            years = YearLocator()
-            months = MonthLocator()
-            yearsFmt = DateFormatter('%Y')
-            monthsFmt = DateFormatter('%m')
-            fig, axes = plt.subplots(2, 3, figsize=(14,8))
-
-            axes[0,0].set_title("V3")
-            plot_single_instrument(axes[0,0], "V3", times, minV3PA_data, maxV3PA_data)
-            axes[0,0].fmt_xdata = DateFormatter('%Y-%m-%d')
-            axes[0,0].set_ylabel("Available Position Angle (Degree)")
-            axes[0,0].set_xlim(Time(search_start, format='mjd').datetime, Time(search_end, format='mjd').datetime)
-            labels = axes[0,0].get_xticklabels()
-            for label in labels:
-                label.set_rotation(30)
+def plot_visibility(result, instrument=None, name=None, save_plot=None):
+    """Plot renderer: the available PAs of a TargetVisibility, for all instruments or only instrument.
+
+    The figure is shown, or saved to save_plot."""
+    times = Time(result.days, format='mjd').datetime
+    tab = result.pa_ranges
+    plt = _pyplot()
+    if instrument is None:
+        years = YearLocator()
+        months = MonthLocator()
+        yearsFmt = DateFormatter('%Y')
+        monthsFmt = DateFormatter('%m')
+        fig, axes = plt.subplots(2, 3, figsize=(14,8))
+
+        axes[0,0].set_title("V3")
+        plot_single_instrument(axes[0,0], "V3", times, tab['V3PA min'], tab['V3PA max'])
+        axes[0,0].fmt_xdata = DateFormatter('%Y-%m-%d')
+        axes[0,0].set_ylabel("Available Position Angle (Degree)")
+        axes[0,0].set_xlim(Time(result.search_start, format='mjd').datetime, Time(result.search_end, format='mjd').datetime)
+        labels = axes[0,0].get_xticklabels()
+        for label in labels:
+            label.set_rotation(30)
+
+        if result.fixed:
+            axes[0,1].set_title('(R.A. = {}, Dec. = {})\n'.format(result.coords[0], result.coords[1])+"NIRCam")
+        plot_single_instrument(axes[0,1], 'NIRCam', times, tab['NIRCam min'], tab['NIRCam max'])
+        axes[0,1].fmt_xdata = DateFormatter('%Y-%m-%d')
+        axes[0,1].set_ylabel("Available Position Angle (Degree)")
+        axes[0,1].set_xlim(Time(result.search_start, format='mjd').datetime, Time(result.search_end, format='mjd').datetime)
+        labels = axes[0,1].get_xticklabels()
+        for label in labels:
+            label.set_rotation(30)
+
+        axes[0,2].set_title("MIRI")
+        plot_single_instrument(axes[0,2], 'MIRI', times, tab['MIRI min'], tab['MIRI max'])
+        axes[0,2].set_xlim(Time(result.search_start, format='mjd').datetime, Time(result.search_end, format='mjd').datetime)
+        labels = axes[0,2].get_xticklabels()
+        for label in labels:
+            label.set_rotation(30)
+
+        axes[1,0].set_title("NIRSpec")
+        axes[1,0].fmt_xdata = DateFormatter('%Y-%m-%d')
+        plot_single_instrument(axes[1,0], 'NIRSpec', times, tab['NIRSpec min'], tab['NIRSpec max'])
+        axes[1,0].set_xlim(Time(result.search_start, format='mjd').datetime, Time(result.search_end, format='mjd').datetime)
+        labels = axes[1,0].get_xticklabels()
+        for label in labels:
+            label.set_rotation(30)
+
+        axes[1,1].set_title("NIRISS")
+        plot_single_instrument(axes[1,1], 'NIRISS', times, tab['NIRISS min'], tab['NIRISS max'])
+        axes[1,1].set_xlim(Time(result.search_start, format='mjd').datetime, Time(result.search_end, format='mjd').datetime)
+        labels = axes[1,1].get_xticklabels()
+        for label in labels:
+            label.set_rotation(30)
+
+        axes[1,2].set_title("FGS")
+        plot_single_instrument(axes[1,2], 'FGS', times, tab['FGS min'], tab['FGS max'])
+        axes[1,2].set_xlim(Time(result.search_start, format='mjd').datetime, Time(result.search_end, format='mjd').datetime)
+        labels = axes[1,2].get_xticklabels()
+        for label in labels:
+            label.set_rotation(30)
+        # fig.autofmt_xdate()
+
+    elif instrument.lower() not in ['v3', 'nircam', 'miri', 'nirspec', 'niriss', 'fgs']:
+        print()
+        print(instrument+" not recognized. --instrument should be one of: v3, nircam, miri, nirspec, niriss, fgs")
+        return
+
+    elif instrument.lower() == 'v3':
+        fig, ax = plt.subplots(figsize=(14,8))
+        plot_single_instrument(ax, 'Observatory V3', times, tab['V3PA min'], tab['V3PA max'])
+        ax.set_xlim(Time(result.search_start, format='mjd').datetime, Time(result.search_end, format='mjd').datetime)
+
+    elif instrument.lower() == 'nircam':
+        fig, ax = plt.subplots(figsize=(14,8))
+        plot_single_instrument(ax, 'NIRCam', times, tab['NIRCam min'], tab['NIRCam max'])
+        ax.set_xlim(Time(result.search_start, format='mjd').datetime, Time(result.search_end, format='mjd').datetime)
+
+    elif instrument.lower() == 'miri':
+        fig, ax = plt.subplots(figsize=(14,8))
+        plot_single_instrument(ax, 'MIRI', times, tab['MIRI min'], tab['MIRI max'])
+        ax.set_xlim(Time(result.search_start, format='mjd').datetime, Time(result.search_end, format='mjd').datetime)
+
+    elif instrument.lower() == 'nirspec':
+        fig, ax = plt.subplots(figsize=(14,8))
+        plot_single_instrument(ax, 'NIRSpec', times, tab['NIRSpec min'], tab['NIRSpec max'])
+        ax.set_xlim(Time(result.search_start, format='mjd').datetime, Time(result.search_end, format='mjd').datetime)
+
+    elif instrument.lower() == 'niriss':
+        fig, ax = plt.subplots(figsize=(14,8))
+        plot_single_instrument(ax, 'NIRISS', times, tab['NIRISS min'], tab['NIRISS max'])
+        ax.set_xlim(Time(result.search_start, format='mjd').datetime, Time(result.search_end, format='mjd').datetime)
+
+    elif instrument.lower() == 'fgs':
+        fig, ax = plt.subplots(figsize=(14,8))
+        plot_single_instrument(ax, 'FGS', times, tab['FGS min'], tab['FGS max'])
+        ax.set_xlim(Time(result.search_start, format='mjd').datetime, Time(result.search_end, format='mjd').datetime)
+
+    if name is not None:
+        targname = name
+    else:
+        targname = ''
+    if result.fixed:
+        suptitle = '{} (RA = {}, DEC = {})'.format(targname, result.coords[0], result.coords[1])
+    else:
+        suptitle = '{}'.format(targname, result.coords[0], result.coords[1])
+    fig.suptitle(suptitle, fontsize=18)
+    fig.tight_layout()
+    fig.subplots_adjust(top=0.88)
 
-            if fixed:
-                axes[0,1].set_title('(R.A. = {}, Dec. = {})\n'.format(args.ra, args.dec)+"NIRCam")
-            plot_single_instrument(axes[0,1], 'NIRCam', times, minNIRCam_PA_data, maxNIRCam_PA_data)
-            axes[0,1].fmt_xdata = DateFormatter('%Y-%m-%d')
-            axes[0,1].set_ylabel("Available Position Angle (Degree)")
-            axes[0,1].set_xlim(Time(search_start, format='mjd').datetime, Time(search_end, format='mjd').datetime)
-            labels = axes[0,1].get_xticklabels()
-            for label in labels:
-                label.set_rotation(30)
-
-            axes[0,2].set_title("MIRI")
-            plot_single_instrument(axes[0,2], 'MIRI', times, minMIRI_PA_data, maxMIRI_PA_data)
-            axes[0,2].set_xlim(Time(search_start, format='mjd').datetime, Time(search_end, format='mjd').datetime)
-            labels = axes[0,2].get_xticklabels()
-            for label in labels:
-                label.set_rotation(30)
-
-            axes[1,0].set_title("NIRSpec")
-            axes[1,0].fmt_xdata = DateFormatter('%Y-%m-%d')
-            plot_single_instrument(axes[1,0], 'NIRSpec', times, minNIRSpec_PA_data, maxNIRSpec_PA_data)
-            axes[1,0].set_xlim(Time(search_start, format='mjd').datetime, Time(search_end, format='mjd').datetime)
-            labels = axes[1,0].get_xticklabels()
-            for label in labels:
-                label.set_rotation(30)
-
-            axes[1,1].set_title("NIRISS")
-            plot_single_instrument(axes[1,1], 'NIRISS', times, minNIRISS_PA_data, maxNIRISS_PA_data)
-            axes[1,1].set_xlim(Time(search_start, format='mjd').datetime, Time(search_end, format='mjd').datetime)
-            labels = axes[1,1].get_xticklabels()
-            for label in labels:
-                label.set_rotation(30)
-
-            axes[1,2].set_title("FGS")
-            plot_single_instrument(axes[1,2], 'FGS', times, minFGS_PA_data, maxFGS_PA_data)
-            axes[1,2].set_xlim(Time(search_start, format='mjd').datetime, Time(search_end, format='mjd').datetime)
-            labels = axes[1,2].get_xticklabels()
-            for label in labels:
-                label.set_rotation(30)
-            # fig.autofmt_xdate()
-
-        elif args.instrument.lower() not in ['v3', 'nircam', 'miri', 'nirspec', 'niriss', 'fgs']:
-            print()
-            print(args.instrument+" not recognized. --instrument should be one of: v3, nircam, miri, nirspec, niriss, fgs")
-            return
-
-        elif args.instrument.lower() == 'v3':
-            fig, ax = plt.subplots(figsize=(14,8))
-            plot_single_instrument(ax, 'Observatory V3', times, minV3PA_data, maxV3PA_data)
-            ax.set_xlim(Time(search_start, format='mjd').datetime, Time(search_end, format='mjd').datetime)
-
-        elif args.instrument.lower() == 'nircam':
-            fig, ax = plt.subplots(figsize=(14,8))
-            plot_single_instrument(ax, 'NIRCam', times, minNIRCam_PA_data, maxNIRCam_PA_data)
-            ax.set_xlim(Time(search_start, format='mjd').datetime, Time(search_end, format='mjd').datetime)
-
-        elif args.instrument.lower() == 'miri':
-            fig, ax = plt.subplots(figsize=(14,8))
-            plot_single_instrument(ax, 'MIRI', times, minMIRI_PA_data, maxMIRI_PA_data)
-            ax.set_xlim(Time(search_start, format='mjd').datetime, Time(search_end, format='mjd').datetime)
-
-        elif args.instrument.lower() == 'nirspec':
-            fig, ax = plt.subplots(figsize=(14,8))
-            plot_single_instrument(ax, 'NIRSpec', times, minNIRSpec_PA_data, maxNIRSpec_PA_data)
-            ax.set_xlim(Time(search_start, format='mjd').datetime, Time(search_end, format='mjd').datetime)
-
-        elif args.instrument.lower() == 'niriss':
-            fig, ax = plt.subplots(figsize=(14,8))
-            plot_single_instrument(ax, 'NIRISS', times, minNIRISS_PA_data, maxNIRISS_PA_data)
-            ax.set_xlim(Time(search_start, format='mjd').datetime, Time(search_end, format='mjd').datetime)
-
-        elif args.instrument.lower() == 'fgs':
-            fig, ax = plt.subplots(figsize=(14,8))
-            plot_single_instrument(ax, 'FGS', times, minFGS_PA_data, maxFGS_PA_data)
-            ax.set_xlim(Time(search_start, format='mjd').datetime, Time(search_end, format='mjd').datetime)
-
-        if args.name is not None:
-            targname = args.name
-        else:
-            targname = ''
-        if fixed:
-            suptitle = '{} (RA = {}, DEC = {})'.format(targname, args.ra, args.dec)
-        else:
-            suptitle = '{}'.format(targname, args.ra, args.dec)
-        fig.suptitle(suptitle, fontsize=18)
-        fig.tight_layout()
-        fig.subplots_adjust(top=0.88)
+    if save_plot is None:
+        plt.show()
+    else:
+        plt.savefig(save_plot)
 
-        if args.save_plot is None:
-            plt.show()
-        else:
-            plt.savefig(args.save_plot)
 
+def main(args, fixed=True):
+    tolerance = getattr(args, 'tolerance', None)
+    if tolerance is None:
+        tolerance = EPH.BISECT_TOLERANCE
+    step = getattr(args, 'step', None)
+    if step is None:
+        step = 1.
+    result = compute_target(args.ra, args.dec, args.start_date, args.end_date, args.v3pa, fixed, tolerance,
+                            step, verbose=args.no_verbose)
+
+    table_output=None
+    if args.save_table is not None:
+        table_output = open(args.save_table, 'w')
+    try:
+        if result.start_clipped:
+            print("Warning, search start time is earlier than ephemeris start.", file=table_output)
+        if not args.no_verbose:
+            print_visibility(result, table_output)
+    finally:
+        if table_output is not None:
+            table_output.close()
+
+    plot_visibility(result, args.instrument, args.name, args.save_plot)
 
-def get_table(ra, dec, instrument=None, start_date=None, end_date=None, save_table=None, v3pa=None, fixed=True, verbose=True):
+
+def get_table(ra, dec, instrument=None, start_date=None, end_date=None, save_table=None, v3pa=None, fixed=True, verbose=True,
+              tolerance=EPH.BISECT_TOLERANCE, step=1.):
     """ Returns a table object with the PAs where the target is visible.
 
     parameters
@@ -537,320 +754,522 @@ def get_table(ra, dec, instrument=None, start_date=None, end_date=None, save_tab
         The position angle of the V3 axis.
     fixed : bool
         Whether or not the target is fixed. default = True
+    tolerance : float
+        Accuracy of the window start and end dates, in days. default = 1e-6
+    step : float
+        Days between the dates searched and between the rows of the table,
+        e.g. 1/24. for hourly rows or 7. for weekly ones. default = 1
 
 
     returns
     -------
     astropy.table Table object
     """
+    result = compute_target(ra, dec, start_date, end_date, v3pa, fixed, tolerance, step, verbose=verbose)
+
     table_output=None
     if save_table is not None:
         table_output = open(save_table, 'w')
+    try:
+        if result.start_clipped:
+            print("Warning, search start time is earlier than ephemeris start.", file=table_output)
+        if verbose:
+            print_visibility(result, table_output, columns=result.pa_ranges.colnames)
+    finally:
+        if table_output is not None:
+            table_output.close()
 
-    NRCALL_FULL_V2IdlYang  = -0.0265
-    NRS_FULL_MSA_V3IdlYang = 137.4874
-    NIS_V3IdlYang          = -0.57
-    MIRIM_FULL_V3IdlYang   = 5.0152
-    FGS1_FULL_V3IdlYang    = -1.2508
+    return visibility_table(result)
 
-    ECL_FLAG = False
 
-    A_eph = EPH.Ephemeris(join(dirname(abspath(__file__)), "horizons_EM_jwst_wrt_sun_2020-2024.txt"),ECL_FLAG, verbose=verbose)
+WINDOW_DTYPE = np.dtype([('start', 'f8'), ('end', 'f8'), ('duration', 'f8'), ('pa_start', 'f8'), ('pa_end', 'f8'),
+                         ('ra_start', 'f8'), ('ra_end', 'f8'), ('dec_start', 'f8'), ('dec_end', 'f8'), ('cvz', '?')])
 
-    search_start = Time(start_date, format='iso').mjd if start_date is not None else 58849.0  #Jan 1, 2020
-    search_end = Time(end_date, format='iso').mjd if end_date is not None else 60309.0 # Dec 31, 2023
+def windows_array(A_eph, windows, cvz, dates, ra, dec):
+    """Packs the (windows, cvz) of scan_windows() into a WINDOW_DTYPE array, angles in degrees.
 
-    if not (58849.0 <= search_start <= 60309.0) and start_date is not None:
-        raise ValueError('Start date {} outside of available ephemeris {} to {}'.format(start_date, '2020-01-01', '2023-12-31'))
-    if not (58849.0 <= search_end <= 60309.0) and end_date is not None:
-        raise ValueError('End date {} outside of available ephemeris {} to {}'.format(end_date, '2020-01-01', '2023-12-31'))
-    if search_start > search_end:
-        raise ValueError('Start date {} should be before end date {}'.format(start_date, end_date))
+    A CVZ target gets a single row over the whole grid of dates, with the
+    normal V3 PAs at its ends."""
+    result = np.zeros(len(windows) + int(cvz), dtype=WINDOW_DTYPE)
+    names = ('start', 'end', 'pa_start', 'pa_end', 'ra_start', 'ra_end', 'dec_start', 'dec_end')
+    if windows:
+        columns = np.array(windows, dtype=np.float64).T
+        for (name, column) in zip(names, columns):
+            result[name][:len(windows)] = column
+    if cvz:
+        result[-1] = (dates[0], dates[-1], 0., A_eph.normal_pa(dates[0], ra[0], dec[0]),
+                      A_eph.normal_pa(dates[-1], ra[-1], dec[-1]), ra[0], ra[-1], dec[0], dec[-1], True)
+    result['duration'] = result['end'] - result['start']
+    for name in names[2:]:
+        result[name] *= R2D
+    return result
 
-    if search_start < A_eph.amin:
-        print("Warning, search start time is earlier than ephemeris start.", file=table_output)
-        search_start = A_eph.amin + 1
+def get_windows(ra, dec, start_date=None, end_date=None, v3pa=None, fixed=True, tolerance=EPH.BISECT_TOLERANCE,
+                step=1., as_table=False):
+    """ Returns the visibility windows printed by get_table(), as data.
 
-    scale = 1  # Channging this value must be reflected in get_target_ephemeris
-    span = int(search_end-search_start)
+    parameters
+    ----------
+    ra : str, float or array
+    dec : str, float or array
+        Fixed target coordinates in either sexagesimal (hh:mm:ss.s,
+        dd:mm:ss.s) or degrees, or for a moving target arrays of degrees
+        with one epoch per step, as from get_target_ephemeris.
+    start_date : str
+    end_date : str
+        Search interval in yyyy-mm-dd format. default = ephemeris coverage
+    v3pa : float
+        If given, windows are the periods where this V3 PA (degrees) is allowed.
+    fixed : bool
+        Whether or not the target is fixed. default = True
+    tolerance : float
+        Accuracy of the window start and end dates, in days. default = 1e-6
+    step : float
+        Days between the dates searched. default = 1
+    as_table : bool
+        Return an astropy Table with 'start' and 'end' as Time columns
+        instead of a NumPy array. default = False
 
-    # if len(sys.argv) < 3:
-    #   print "proper usage:"
-    #   print "find_tgt_info.py ra dec [pa]"
-    #   print "finds full visibility windows over [{}, {}]".format(Time(search_start, format='mjd', out_subfmt='date').isot,
-    #     Time(search_start+span/scale, format='mjd', out_subfmt='date').isot)
-    #   sys.exit(1)
-
-    pa = 'X'
-
-    if ra.find(':')>-1:  #format is hh:mm:ss.s or  dd:mm:ss.s
-      ra  = convert_ddmmss_to_float(ra) * 15. * D2R
-      dec   = convert_ddmmss_to_float(dec) * D2R
-    else: #format is decimal
-      ra  = float(ra) * D2R
-      dec   = float(dec) * D2R
-
-    # although the coordinates are fixed, we need an array for
-    # symmetry with moving target ephemerides
-    ra = np.repeat(ra, span * scale + 1)
-    dec = np.repeat(dec, span * scale + 1)
-
-    if verbose:
-        print("", file=table_output)
-        print("       Target", file=table_output)
-    
-    if verbose:
-        if fixed:
-            print("                ecliptic", file=table_output)
-            print("RA      Dec     latitude", file=table_output)
-            print("%7.3f %7.3f %7.3f" % (ra[0]*R2D,dec[0]*R2D,calc_ecliptic_lat(ra[0], dec[0])*R2D), file=table_output)
-        print("", file=table_output)
-
-
-    if v3pa is not None:
-        pa     = float(v3pa) * D2R
-    if verbose:
-        print("Checked interval [{}, {}]".format(Time(search_start, format='mjd', out_subfmt='date').isot,
-            Time(search_start+span, format='mjd', out_subfmt='date').isot), file=table_output)
-    if pa == "X":
-        iflag_old = A_eph.in_FOR(search_start,ra[0],dec[0])
-        if verbose:
-            print("|           Window [days]                 |    Normal V3 PA [deg]    |", end='', file=table_output)
-    else:
-        iflag_old = A_eph.is_valid(search_start,ra[0],dec[0],pa)
-        if verbose:
-            print("|           Window [days]                 |   Specified V3 PA [deg]  |", end='', file=table_output)
+    returns
+    -------
+    windows : numpy structured array of WINDOW_DTYPE
+        One row per window with fields 'start', 'end' (MJD), 'duration'
+        (days), 'pa_start', 'pa_end', 'ra_start', 'ra_end', 'dec_start',
+        'dec_end' (degrees) and 'cvz'.  A CVZ target has a single row
+        with cvz set, spanning the search interval.
+    """
+    target = compute_target(ra, dec, start_date, end_date, v3pa, fixed, tolerance, step, pa_ranges=False)
+    result = windows_array(target.ephemeris, target.windows, target.cvz, target.dates, target.ra, target.dec)
+    if as_table:
+        result = Table(result)
+        result['start'] = Time(result['start'], format='mjd')
+        result['end'] = Time(result['end'], format='mjd')
+    return result
 
-    if fixed:
-        if verbose:
-            print('\n', end='', file=table_output)
-    else:
-        if verbose:
-            print('{:^27s}|{:^27s}|'.format('RA', 'Dec'), file=table_output)
 
-    if verbose:
-        print("   Start           End         Duration         Start         End    ", end='', file=table_output)
-    if fixed:
-        if verbose:
-            print("{:^13s} {:^13s}".format('RA', 'Dec'), file=table_output)
-    else:
-        if verbose:
-            print("{:^13s} {:^13s} {:^13s} {:^13s}".format('Start', 'End', 'Start', 'End'), file=table_output)
+VISIBILITY_CHUNK = 2048  # targets evaluated together by compute_visibility
 
-    if iflag_old:
-      twstart = search_start
-      ra_start = ra[0]
-      dec_start = dec[0]
+def scan_windows_many(A_eph, dates, ra, dec, pa=None, tol=EPH.BISECT_TOLERANCE):
+    """scan_windows() for many fixed targets: ra and dec are arrays of radians, one per target.
+
+    Returns (target, wstart, wend, cvz): one row per window, in target and
+    time order, then the CVZ flag of each target (always False with a pa)."""
+    if pa is None:
+        flags = A_eph.in_FOR_many(dates, ra[:, np.newaxis], dec[:, np.newaxis])
     else:
-      twstart = -1.
-    iflip = False
+        flags = A_eph.is_valid_many(dates, ra[:, np.newaxis], dec[:, np.newaxis], pa)
+
+    #Bracket every in/out transition and refine them all together.
+    (tgt, col) = np.nonzero(flags[:, 1:] != flags[:, :-1])
+    col += 1
+    entering = flags[tgt, col]
+    edges = A_eph.bisect_many(np.where(entering, dates[col], dates[col-1]),
+                              np.where(entering, dates[col-1], dates[col]),
+                              ra[tgt], dec[tgt], pa, tol=tol)
+    return _pair_windows(tgt, edges, entering, flags[:, 0], flags[:, -1], dates[0], dates[-1], pa is None)
+
+def adaptive_windows_many(A_eph, start, end, ra, dec, tol=EPH.BISECT_TOLERANCE):
+    """Field of regard windows of fixed targets between start and end (MJD) by adaptive stepping.
+
+    ra and dec are arrays of radians.  The transitions are bracketed with
+    Ephemeris.step_FOR_many, whose steps are bounded by the Sun's angular
+    rate, then refined together by bisection to tol days.  This takes far
+    fewer separation evaluations than a daily grid and, unlike the grid,
+    also finds windows and gaps shorter than a day.  Returns (target,
+    wstart, wend, cvz) as scan_windows_many()."""
+    (tgt, before, after, entering, first, last) = A_eph.step_FOR_many(start, end, ra, dec)
+    edges = A_eph.bisect_many(np.where(entering, after, before), np.where(entering, before, after),
+                              ra[tgt], dec[tgt], tol=tol)
+    return _pair_windows(tgt, edges, entering, first, last, float(start), float(end), True)
+
+def _pair_windows(tgt, edges, entering, first, last, start, end, fov):
+    """Pairs the entries and exits of targets, in time order for each, into windows.
+
+    Windows run from an entry, or start, to the next exit, or end.  first and
+    last are the in/out states of the targets at start and end.  Returns
+    (target, wstart, wend, cvz); cvz is only set for field of regard (fov) windows."""
+    flips = np.zeros(len(first), dtype=bool)
+    flips[tgt] = True
+    open_start = np.flatnonzero(flips & first)
+    open_end = np.flatnonzero(flips & last)
+    start_tgt = np.concatenate([open_start, tgt[entering]])
+    wstart = np.concatenate([np.full(len(open_start), start), edges[entering]])
+    end_tgt = np.concatenate([tgt[~entering], open_end])
+    wend = np.concatenate([edges[~entering], np.full(len(open_end), end)])
+    cvz = ~flips & last & fov
+    start_order = np.lexsort((wstart, start_tgt))
+    return (start_tgt[start_order], wstart[start_order], wend[np.lexsort((wend, end_tgt))], cvz)
+
+def _windows_many(A_eph, dates, ra, dec, pa, tol, method):
+    """Windows of fixed targets (radians) over dates with one of the methods of compute_visibility."""
+    if pa is None and method == 'inversion':
+        (w_tgt, start, end, cvz, fallback) = A_eph.sun_longitude_map().windows(ra, dec, dates[0], dates[-1], tol)
+        rows = np.flatnonzero(fallback)
+        if len(rows):
+            #Targets near a tangency of the separation limits are stepped through instead.
+            (f_tgt, f_start, f_end, f_cvz) = adaptive_windows_many(A_eph, dates[0], dates[-1], ra[rows], dec[rows], tol)
+            cvz[rows] = f_cvz
+            w_tgt = np.concatenate((w_tgt, rows[f_tgt]))
+            order = np.lexsort((np.concatenate((start, f_start)), w_tgt))
+            (w_tgt, start, end) = (w_tgt[order], np.concatenate((start, f_start))[order],
+                                   np.concatenate((end, f_end))[order])
+        return (w_tgt, start, end, cvz)
+    elif pa is None and method == 'adaptive':
+        return adaptive_windows_many(A_eph, dates[0], dates[-1], ra, dec, tol)
+    return scan_windows_many(A_eph, dates, ra, dec, pa, tol)
+
+def visibility_dates(A_eph, start_date=None, end_date=None, step=1.):
+    """Grid of dates (MJD), every step days, on which compute_visibility evaluates the targets."""
+    (search_start, search_end) = search_interval(A_eph, start_date, end_date)
+    return time_grid(search_start, search_end - search_start, step)
+
+def compute_visibility(ra, dec, start_date=None, end_date=None, v3pa=None, pa_ranges=True,
+                       tolerance=EPH.BISECT_TOLERANCE, chunk=VISIBILITY_CHUNK, method='inversion', step=1.):
+    """ Visibility windows and V3 PA ranges of many fixed targets at once.
+
+    All targets are evaluated on the same grid of dates and share one
+    Sun table.  They are processed chunk targets at a time, after
+    screen_targets() has set aside those that are certainly CVZ or never
+    visible over the interval.  Field of
+    regard windows are solved for with the ephemeris' SunLongitudeMap,
+    in time proportional to the number of windows, and targets the map
+    cannot handle are stepped through adaptively.  Windows for a v3pa are
+    scanned as (targets, dates) arrays.  Either way the window edges of a
+    chunk are refined by one vectorized bisection.
 
-    #Step througth the interval and find where target goes in/out of field of regard.
-    for i in range(1,span*scale+1):
-        adate = search_start + float(i)/float(scale)
-        #iflag = A_eph.in_FOR(adate,ra,dec)
-        if pa == "X":
-            iflag = A_eph.in_FOR(adate,ra[i],dec[i])
-        else:
-            iflag = A_eph.is_valid(adate,ra[i],dec[i],pa)
-        if iflag != iflag_old:
-            iflip = True
-            if iflag:
-                if pa == "X":
-                    twstart = A_eph.bisect_by_FOR(adate,adate-0.1,ra[i],dec[i])
-                else:
-                    twstart = A_eph.bisect_by_attitude(adate,adate-0.1,ra[i],dec[i],pa)
-                ra_start = ra[i]
-                dec_start = dec[i]
-            else:
-                if pa == "X":
-                    wend = A_eph.bisect_by_FOR(adate-0.1,adate,ra[i],dec[i])
-                else:
-                    wend = A_eph.bisect_by_attitude(adate-0.1,adate,ra[i],dec[i],pa)
-                if twstart > 0.:
-                    wstart = twstart #Only set wstart if wend is valid
-                    if pa == "X":
-                        pa_start = A_eph.normal_pa(wstart,ra_start,dec_start)
-                        pa_end   = A_eph.normal_pa(wend,ra[i],dec[i])
-                    else:
-                        pa_start = pa
-                        pa_end = pa
-                    ra_end = ra[i]
-                    dec_end = dec[i]
-                    if verbose:
-                        print(window_summary_line(fixed, wstart, wend, pa_start, pa_end, ra_start, ra_end, dec_start, dec_end), file=table_output)
-            iflag_old = iflag
-
-    if iflip == True and iflag == True:
-        if pa == "X":
-            pa_start = A_eph.normal_pa(twstart,ra[i],dec[i])
-            pa_end   = A_eph.normal_pa(adate,ra[i],dec[i])
-        else:
-            pa_start = pa
-            pa_end = pa
-        if verbose:
-            print(window_summary_line(fixed, twstart, adate, pa_start, pa_end, ra[i], ra[i], dec[i], dec[i]), file=table_output)
+    parameters
+    ----------
+    ra : array_like
+        Right Ascensions in degrees
+    dec : array_like
+        Declinations in degrees
+    start_date : str
+    end_date : str
+        Search interval in yyyy-mm-dd format. default = ephemeris coverage
+    v3pa : float
+        If given, windows are the periods where this V3 PA (degrees) is allowed.
+    pa_ranges : bool
+        Whether to compute the V3 PA ranges on each date. default = True
+    tolerance : float
+        Accuracy of the window start and end dates, in days. default = 1e-6
+    chunk : int
+        Number of targets evaluated together.
+    step : float
+        Days between the dates of the grid. default = 1
+    method : str
+        'inversion' (default), 'adaptive' to step through the interval
+        with steps bounded by the Sun's angular rate, or 'scan' to step
+        through the grid of dates for the field of regard windows too.
 
-    if iflip == False and iflag == True and pa == "X":
-        if dec[i] >0.:
-            if verbose:
-                print(window_summary_line(fixed, 0, 0, 2 * np.pi, 0, ra[0], ra[-1], dec[0], dec[-1], cvz=True), file=table_output)
+    returns
+    -------
+    targets : astropy.table Table
+        One row per target with columns 'RA', 'Dec', 'CVZ' and, if
+        pa_ranges, 'V3PA min' and 'V3PA max' holding one float32 value per
+        date of targets.meta['dates'] (MJD), NaN out of the field of regard.
+    windows : astropy.table Table
+        One row per window with columns 'Target' (row in targets), 'Start',
+        'End' (MJD), 'Duration' (days), 'V3PA start' and 'V3PA end' (degrees).
+    """
+    ra = np.atleast_1d(np.asarray(ra, dtype=np.float64))
+    dec = np.atleast_1d(np.asarray(dec, dtype=np.float64))
+    pa = None if v3pa is None else float(v3pa) * D2R
+
+    A_eph = EPH.get_ephemeris(EPH.DEFAULT_EPHEMERIS, False)
+    dates = visibility_dates(A_eph, start_date, end_date, step)
+    A_eph.sun_table(dates)
+
+    cvz = np.zeros(len(ra), dtype=bool)
+    if pa_ranges:
+        min_pa = np.full((len(ra), len(dates)), np.nan, dtype=np.float32)
+        max_pa = np.full((len(ra), len(dates)), np.nan, dtype=np.float32)
+    names = ('Target', 'Start', 'End', 'V3PA start', 'V3PA end')
+    columns = dict((name, [np.zeros(0)]) for name in names)
+
+    for first in range(0, len(ra), chunk):
+        c_ra = ra[first:first+chunk] * D2R
+        c_dec = dec[first:first+chunk] * D2R
+
+        #Only targets the closed-form screen cannot classify are solved for.
+        (c_cvz, never) = screen_targets(A_eph, c_ra, c_dec, dates[0], dates[-1])
+        c_cvz &= pa is None
+        rows = np.flatnonzero(~(c_cvz | never))
+        (w_tgt, start, end, r_cvz) = _windows_many(A_eph, dates, c_ra[rows], c_dec[rows], pa, tolerance, method)
+        w_tgt = rows[w_tgt]
+        c_cvz[rows] = r_cvz
+
+        columns['Target'].append(first + w_tgt)
+        columns['Start'].append(start)
+        columns['End'].append(end)
+        if pa is None:
+            columns['V3PA start'].append(A_eph.normal_pa_many(start, c_ra[w_tgt], c_dec[w_tgt]) * R2D)
+            columns['V3PA end'].append(A_eph.normal_pa_many(end, c_ra[w_tgt], c_dec[w_tgt]) * R2D)
+            cvz[first:first+chunk] = c_cvz
         else:
-            if verbose:
-                print(window_summary_line(fixed, 0, 0, 0, 2 * np.pi, ra[0], ra[-1], dec[0], dec[-1], cvz=True), file=table_output)
-
-    if 1==1:
-        wstart = search_start
-        wend = wstart + span
-        istart = int(wstart)
-        iend = int(wend)
-        iflag = A_eph.in_FOR(wstart,ra[0],dec[0])
-        tgt_is_in = False
-        if iflag:
-          tgt_is_in = True
-
-        if verbose:
-            print("", file=table_output)
-            print("", file=table_output)
-        if fixed:
-            fmt_repeats = 6
-            if verbose:
-                print("                V3PA          NIRCam           NIRSpec         NIRISS           MIRI          FGS", file=table_output)
-                print("   Date      min    max      min    max       min    max     min    max      min    max      min    max", file=table_output)
-                    #58849.0 264.83 275.18 264.80 264.80  42.32  42.32 264.26 264.26 269.84 269.84 263.58 263.58
+            columns['V3PA start'].append(np.full(len(start), float(v3pa)))
+            columns['V3PA end'].append(np.full(len(start), float(v3pa)))
+
+        rows = np.flatnonzero(~never)
+        if pa_ranges and len(rows):
+            #V3 PA range on each date, NaN wherever the target is out of the field of regard.
+            V3PA = A_eph.normal_pa_many(dates, c_ra[rows, np.newaxis], c_dec[rows, np.newaxis]) * R2D
+            (sun_ra, sun_dec) = A_eph.sun_pos_many(dates)
+            max_roll = allowed_max_vehicle_roll_many(sun_ra, sun_dec, c_ra[rows, np.newaxis], c_dec[rows, np.newaxis]) * R2D
+            min_pa[first + rows] = bound_angle_many(V3PA - max_roll)
+            max_pa[first + rows] = bound_angle_many(V3PA + max_roll)
+
+    windows = Table([np.concatenate(columns[name]) for name in names], names=names)
+    windows['Target'] = windows['Target'].astype(int)
+    windows.add_column(windows['End'] - windows['Start'], name='Duration', index=3)
+
+    targets = Table([ra, dec, cvz], names=('RA', 'Dec', 'CVZ'))
+    if pa_ranges:
+        targets['V3PA min'] = min_pa
+        targets['V3PA max'] = max_pa
+    targets.meta['dates'] = dates
+    return (targets, windows)
+
+
+SHARDS_PER_WORKER = 4  # tasks per worker in iter_visibility, so uneven shards still balance
+
+def _init_visibility_worker(directory):
+    """Process pool initializer: maps the ephemeris published by the parent and builds the roll table."""
+    EPH.attach_ephemeris(directory)
+    max_vehicle_roll_table()
+
+def _visibility_shard(kwargs, coords):
+    return compute_visibility(coords[0], coords[1], **kwargs)
+
+def iter_visibility(ra, dec, workers=None, shard=None, pool='process', **kwargs):
+    """ Runs compute_visibility() over a catalog shard by shard.
+
+    Yields (first, targets, windows) for consecutive shards of up to shard
+    targets, in input order; first is the catalog index of the shard's first
+    target and windows['Target'] is already offset by it.  shard defaults to
+    SHARDS_PER_WORKER shards per worker, at most VISIBILITY_CHUNK targets
+    each, so every worker has work.  With workers > 1 the shards are spread
+    over a process pool.  The parent computes the
+    ephemeris and Sun table once and publishes them to a temporary
+    directory, which the workers memory map (EPH.attach_ephemeris) rather
+    than loading their own copies.  Results still come back in input order
+    as soon as the next shard is done, and shards not yet started are
+    cancelled if the generator is closed early.
+
+    With pool='thread' the shards run on a ThreadPoolExecutor in this
+    process instead.  compute_visibility only keeps state in local arrays
+    and the shared ephemeris is read-only, and its work is done in NumPy
+    calls on (targets, dates) arrays that release the GIL.  Other keyword
+    arguments go to compute_visibility.
+    """
+    ra = np.atleast_1d(np.asarray(ra, dtype=np.float64))
+    dec = np.atleast_1d(np.asarray(dec, dtype=np.float64))
+    if shard is None:
+        shard = min(max(int(ceil(len(ra) / float(SHARDS_PER_WORKER * max(workers or 1, 1)))), 1), VISIBILITY_CHUNK)
+    starts = range(0, len(ra), shard)
+    shards = ((ra[first:first+shard], dec[first:first+shard]) for first in starts)
+    task = functools.partial(_visibility_shard, kwargs)
+    executor = None
+    futures = []
+    shared_dir = None
+    try:
+        if workers is None or workers <= 1:
+            results = map(task, shards)
+        elif pool == 'thread':
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+            futures = [executor.submit(task, coords) for coords in shards]
+            results = (future.result() for future in futures)
         else:
-            fmt_repeats = 7
-            if verbose:
-                print("                                V3PA          NIRCam           NIRSpec         NIRISS           MIRI          FGS", file=table_output)
-                print("   Date      RA     Dec      min    max      min    max       min    max     min    max      min    max      min    max", file=table_output)
-        
-        times = []
-        V3PA_data = []
-        minV3PA_data = []
-        maxV3PA_data = []
-        minNIRCam_PA_data = []
-        maxNIRCam_PA_data = []
-        minNIRSpec_PA_data = []
-        maxNIRSpec_PA_data = []
-        minNIRISS_PA_data = []
-        maxNIRISS_PA_data = []
-        minMIRI_PA_data = []
-        maxMIRI_PA_data = []
-        minFGS_PA_data = []
-        maxFGS_PA_data = []
-
-        nomNIRCam_PA_data = []
-        nomNIRSpec_PA_data = []
-        nomNIRISS_PA_data = []
-        nomMIRI_PA_data = []
-        nomFGS_PA_data = []
-
-        for itime in range(istart,iend):
-            atime = float(itime)
-            i = int((atime - search_start) * float(scale))
-            iflag = A_eph.in_FOR(atime,ra[i],dec[i])
-            #print atime,A_eph.in_FOR(atime,ra,dec)
-            if iflag:
-                if not tgt_is_in:
-                    if verbose:
-                        print("", file=table_output)
-                tgt_is_in = True
-
-                V3PA = A_eph.normal_pa(atime,ra[i],dec[i])*R2D
-                (sun_ra, sun_dec) = A_eph.sun_pos(atime)
-                max_boresight_roll = allowed_max_vehicle_roll(sun_ra, sun_dec, ra[i], dec[i]) * R2D
-                #sun_ang = angular_sep(sun_ra, sun_dec, ra, dec) * R2D
-
-                minV3PA = bound_angle(V3PA - max_boresight_roll)
-                maxV3PA = bound_angle(V3PA + max_boresight_roll)
-                minNIRCam_PA = bound_angle(V3PA - max_boresight_roll + NRCALL_FULL_V2IdlYang)
-                maxNIRCam_PA = bound_angle(V3PA + max_boresight_roll + NRCALL_FULL_V2IdlYang)
-                minNIRSpec_PA = bound_angle(V3PA - max_boresight_roll + NRS_FULL_MSA_V3IdlYang)
-                maxNIRSpec_PA = bound_angle(V3PA + max_boresight_roll + NRS_FULL_MSA_V3IdlYang)
-                minNIRISS_PA = bound_angle(V3PA - max_boresight_roll + NIS_V3IdlYang)
-                maxNIRISS_PA = bound_angle(V3PA + max_boresight_roll + NIS_V3IdlYang)
-                minMIRI_PA = bound_angle(V3PA - max_boresight_roll + MIRIM_FULL_V3IdlYang)
-                maxMIRI_PA = bound_angle(V3PA + max_boresight_roll + MIRIM_FULL_V3IdlYang)
-                minFGS_PA = bound_angle(V3PA - max_boresight_roll + FGS1_FULL_V3IdlYang)
-                maxFGS_PA = bound_angle(V3PA + max_boresight_roll + FGS1_FULL_V3IdlYang)
-
-                nomNIRCam_PA = bound_angle(V3PA + NRCALL_FULL_V2IdlYang)
-                nomNIRSpec_PA = bound_angle(V3PA + NRS_FULL_MSA_V3IdlYang)
-                nomNIRISS_PA = bound_angle(V3PA + NIS_V3IdlYang)
-                nomMIRI_PA = bound_angle(V3PA + MIRIM_FULL_V3IdlYang)
-                nomFGS_PA = bound_angle(V3PA + FGS1_FULL_V3IdlYang)
-
-                times.append(Time(atime, format='mjd').datetime)
-                V3PA_data.append(V3PA)
-                minV3PA_data.append(minV3PA)
-                maxV3PA_data.append(maxV3PA)
-                minNIRCam_PA_data.append(minNIRCam_PA)
-                maxNIRCam_PA_data.append(maxNIRCam_PA)
-                minNIRSpec_PA_data.append(minNIRSpec_PA)
-                maxNIRSpec_PA_data.append(maxNIRSpec_PA)
-                minNIRISS_PA_data.append(minNIRISS_PA)
-                maxNIRISS_PA_data.append(maxNIRISS_PA)
-                minMIRI_PA_data.append(minMIRI_PA)
-                maxMIRI_PA_data.append(maxMIRI_PA)
-                minFGS_PA_data.append(minFGS_PA)
-                maxFGS_PA_data.append(maxFGS_PA)
-
-                nomNIRCam_PA_data.append(nomNIRCam_PA)
-                nomNIRSpec_PA_data.append(nomNIRSpec_PA)
-                nomNIRISS_PA_data.append(nomNIRISS_PA)
-                nomMIRI_PA_data.append(nomMIRI_PA)
-                nomFGS_PA_data.append(nomFGS_PA)
-                #print '%7.1f %6.2f %6.2f %6.2f' % (atime, V3PA, NIRCam_PA, NIRSpec_PA)
-                fmt = '{}' + '   {:6.2f} {:6.2f}'*fmt_repeats
-                if fixed:
-                    if verbose:
-                        print(fmt.format(
-                            Time(atime, format='mjd', out_subfmt='date').isot, V3PA, minV3PA, maxV3PA,
-                            nomNIRCam_PA, minNIRCam_PA, maxNIRCam_PA, nomNIRSpec_PA, minNIRSpec_PA, maxNIRSpec_PA,
-                            nomNIRISS_PA, minNIRISS_PA, maxNIRISS_PA, nomMIRI_PA, minMIRI_PA, maxMIRI_PA,
-                            nomFGS_PA, minFGS_PA, maxFGS_PA), file=table_output)#,sun_ang
-                else:
-                    if verbose:
-                        print(fmt.format(
-                            Time(atime, format='mjd', out_subfmt='date').isot, ra[i]*R2D, dec[i]*R2D, V3PA, minV3PA, maxV3PA,
-                            nomNIRCam_PA, minNIRCam_PA, maxNIRCam_PA, nomNIRSpec_PA, minNIRSpec_PA, maxNIRSpec_PA,
-                            nomNIRISS_PA, minNIRISS_PA, maxNIRISS_PA, nomMIRI_PA, minMIRI_PA, maxMIRI_PA,
-                            nomFGS_PA, minFGS_PA, maxFGS_PA), file=table_output)#,sun_ang
-            else:
-                tgt_is_in = False
-                times.append(Time(atime, format='mjd').datetime)
-                V3PA_data.append(np.nan)
-                minV3PA_data.append(np.nan)
-                maxV3PA_data.append(np.nan)
-                minNIRCam_PA_data.append(np.nan)
-                maxNIRCam_PA_data.append(np.nan)
-                minNIRSpec_PA_data.append(np.nan)
-                maxNIRSpec_PA_data.append(np.nan)
-                minNIRISS_PA_data.append(np.nan)
-                maxNIRISS_PA_data.append(np.nan)
-                minMIRI_PA_data.append(np.nan)
-                maxMIRI_PA_data.append(np.nan)
-                minFGS_PA_data.append(np.nan)
-                maxFGS_PA_data.append(np.nan)
-
-                nomNIRCam_PA_data.append(np.nan)
-                nomNIRSpec_PA_data.append(np.nan)
-                nomNIRISS_PA_data.append(np.nan)
-                nomMIRI_PA_data.append(np.nan)
-                nomFGS_PA_data.append(np.nan)
-
-
-        tab = Table([times, V3PA_data, minV3PA_data, maxV3PA_data, nomNIRCam_PA_data, minNIRCam_PA_data, maxNIRCam_PA_data,
-            nomNIRSpec_PA_data, minNIRSpec_PA_data, maxNIRSpec_PA_data, nomNIRISS_PA_data, minNIRISS_PA_data, maxNIRISS_PA_data,
-            nomMIRI_PA_data, minMIRI_PA_data, maxMIRI_PA_data, nomFGS_PA_data, minFGS_PA_data, maxFGS_PA_data],
-            names=('Date', 'V3PA', 'V3PA min', 'V3PA max', 'NIRCam nom', 'NIRCam min', 'NIRCam max',
-                'NIRSpec nom', 'NIRSpec min', 'NIRSpec max', 'NIRISS nom', 'NIRISS min', 'NIRISS max',
-                'MIRI nom', 'MIRI min', 'MIRI max', 'FGS nom', 'FGS min', 'FGS max'))
-
-    return tab
-
-
+            A_eph = EPH.get_ephemeris(EPH.DEFAULT_EPHEMERIS, False)
+            A_eph.sun_table(visibility_dates(A_eph, kwargs.get('start_date'), kwargs.get('end_date'), kwargs.get('step', 1.)))
+            shared_dir = EPH.publish_ephemeris(tempfile.mkdtemp(prefix='jwst_gtvt_'))
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_visibility_worker,
+                                                              initargs=(shared_dir,))
+            futures = [executor.submit(task, coords) for coords in shards]
+            results = (future.result() for future in futures)
+        for (first, (targets, windows)) in zip(starts, results):
+            windows['Target'] += first
+            yield (first, targets, windows)
+    finally:
+        for future in futures:
+            future.cancel()  # no-op for shards already running or done
+        if executor is not None:
+            executor.shutdown()
+        if shared_dir is not None:
+            shutil.rmtree(shared_dir, ignore_errors=True)
+
+class VisibilitySweep(object):
+    """ Sweep line over the field of regard entries and exits of a catalog.
+
+    The windows of each target, as returned by compute_visibility(), are
+    turned into a time ordered stream of ENTRY and EXIT events.  The streams
+    of all targets are merged through a heap holding the next event of each
+    target, so a pass over the catalog costs O((N + events) log N) and
+    questions about a time range stop as soon as it is over, instead of
+    evaluating every target on every day.  Entries and exits are the edges
+    refined like Ephemeris.bisect_by_FOR, so a target is visible on a date
+    when Ephemeris.in_FOR would say so on the grid of dates.  Windows already
+    open at the start of the interval have no ENTRY event, and CVZ targets
+    have no events at all but count as visible throughout.
 
+    parameters
+    ----------
+    targets : astropy.table Table
+    windows : astropy.table Table
+        Output of compute_visibility (without a v3pa for field of regard windows).
+    """
+    ENTRY = 0
+    QUERY = 1  # between the two so windows include their end dates
+    EXIT = 2
+
+    def __init__(self, targets, windows):
+        self.dates = targets.meta['dates']
+        (self.start, self.end) = (float(self.dates[0]), float(self.dates[-1]))
+        self.cvz = np.flatnonzero(np.asarray(targets['CVZ']))
+        tgt = np.asarray(windows['Target'], dtype=int)
+        order = np.lexsort((np.asarray(windows['Start']), tgt))
+        tgt = tgt[order]
+        #One row per event, alternating entry and exit within each target.
+        self.times = np.column_stack((np.asarray(windows['Start'])[order],
+                                      np.asarray(windows['End'])[order])).ravel()
+        self.kinds = np.tile([self.ENTRY, self.EXIT], len(tgt))
+        self.kinds[0::2][self.times[0::2] <= self.start] = -1  # open at the start
+        self.targets = np.repeat(tgt, 2)
+        self.bounds = np.searchsorted(self.targets, np.arange(len(targets) + 1))
+        self.open = np.flatnonzero(self.kinds == -1) // 2
+
+    @classmethod
+    def from_catalog(cls, ra, dec, start_date=None, end_date=None, **kwargs):
+        """Sweep over the field of regard windows of fixed targets (degrees), see compute_visibility."""
+        return cls(*compute_visibility(ra, dec, start_date, end_date, pa_ranges=False, **kwargs))
+
+    def events(self, queries=(), start=None):
+        """Yields (date, kind, target) for every event in time order.
+
+        queries are dates (MJD) to interleave as QUERY events, with target
+        set to the index of the query, after the entries and before the exits
+        happening at the same date.  With start (MJD) the stream begins at the
+        first event of each target on or after start."""
+        first = self.bounds[:-1]
+        if start is not None:
+            #Events of a target are in time order, so skip those before start.
+            first = first + np.bincount(self.targets[self.times < start], minlength=len(first))
+        heap = [(self.times[i], self.kinds[i], int(self.targets[i]), i)
+                for i in first[first < self.bounds[1:]]]
+        heap.extend((float(date), self.QUERY, k, -1) for (k, date) in enumerate(queries))
+        heapq.heapify(heap)
+        while heap:
+            (date, kind, target, i) = heap[0]
+            if i >= 0 and i + 1 < self.bounds[target + 1]:
+                heapq.heapreplace(heap, (self.times[i+1], self.kinds[i+1], target, i + 1))
+            else:
+                heapq.heappop(heap)
+            if kind != -1:
+                yield (date, kind, target)
+
+    def counts(self, dates=None):
+        """Number of targets in the field of regard on each date (MJD), default the grid of compute_visibility."""
+        if dates is None:
+            dates = self.dates
+        dates = np.atleast_1d(np.asarray(dates, dtype=np.float64))
+        counts = np.zeros(len(dates), dtype=int)
+        visible = len(self.cvz) + len(self.open)
+        for (date, kind, target) in self.events(dates):
+            if kind == self.ENTRY:
+                visible += 1
+            elif kind == self.EXIT:
+                visible -= 1
+            else:
+                inside = (date >= self.start) & (date <= self.end)
+                counts[target] = visible if inside else 0
+        return counts
+
+    def entering(self, start, end):
+        """Targets entering the field of regard between start and end (MJD).
+
+        Returns a list of (date, target) in time order."""
+        entries = []
+        for (date, kind, target) in self.events(start=start):
+            if date >= end:
+                break
+            if kind == self.ENTRY and date >= start:
+                entries.append((date, target))
+        return entries
+
+    def exiting(self, start, end):
+        """Targets leaving the field of regard between start and end (MJD), as entering()."""
+        exits = []
+        for (date, kind, target) in self.events(start=start):
+            if date >= end:
+                break
+            if kind == self.EXIT and date >= start and date < self.end:
+                exits.append((date, target))
+        return exits
+
+def read_catalog(path):
+    """Reads a target list: one "RA Dec [name]" line per target, '#' starts a comment.
+
+    RA and Dec are in degrees or sexagesimal (hh:mm:ss.s dd:mm:ss.s) as on the
+    command line.  Returns (ra, dec) arrays in degrees and the list of names,
+    which default to the line number of the target."""
+    ra = []
+    dec = []
+    names = []
+    with open(path) as f:
+        for (lineno, line) in enumerate(f, 1):
+            fields = line.split('#')[0].split(None, 2)
+            if not fields:
+                continue
+            if len(fields) < 2:
+                raise ValueError('{}:{}: expected "RA Dec [name]", got {!r}'.format(path, lineno, line.strip()))
+            if fields[0].find(':')>-1:  #format is hh:mm:ss.s or  dd:mm:ss.s
+                ra.append(convert_ddmmss_to_float(fields[0]) * 15.)
+                dec.append(convert_ddmmss_to_float(fields[1]))
+            else:
+                ra.append(float(fields[0]))
+                dec.append(float(fields[1]))
+            names.append(fields[2].strip() if len(fields) > 2 else str(lineno))
+    return (np.array(ra), np.array(dec), names)
+
+def batch_main(args):
+    """Prints the visibility windows of every target of args.catalog, streaming shard by shard."""
+    (ra, dec, names) = read_catalog(args.catalog)
+    v3pa = float(args.v3pa) if args.v3pa is not None else None
+    tolerance = getattr(args, 'tolerance', None)
+    if tolerance is None:
+        tolerance = EPH.BISECT_TOLERANCE
+    step = getattr(args, 'step', None)
+    if step is None:
+        step = 1.
+    _check_step(step)
+
+    table_output = None
+    if args.save_table is not None:
+        table_output = open(args.save_table, 'w')
+    try:
+        width = max([len(name) for name in names] + [6])
+        if not args.no_verbose:
+            print("{:{}} {:15} {:11} {:>11} {:>13} {:>13} {:>13} {:>13}".format(
+                'Target', width, 'Start', 'End', 'Duration', 'V3PA start', 'V3PA end', 'RA', 'Dec'), file=table_output)
+        for (first, targets, windows) in iter_visibility(ra, dec, workers=args.workers, start_date=args.start_date,
+                                                         end_date=args.end_date, v3pa=v3pa, pa_ranges=False,
+                                                         tolerance=tolerance, step=step):
+            if args.no_verbose:
+                continue
+            starts = Time(windows['Start'], format='mjd').isot if len(windows) else []
+            ends = Time(windows['End'], format='mjd').isot if len(windows) else []
+            rows = [(int(k), "{:15} {:11} {:11.2f} {:13.5f} {:13.5f} ".format(
+                        start[:10], end[:10], duration, pa_start, pa_end))
+                    for (k, start, end, duration, pa_start, pa_end) in zip(windows['Target'], starts, ends,
+                        windows['Duration'], windows['V3PA start'], windows['V3PA end'])]
+            for k in np.flatnonzero(targets['CVZ']):
+                (pa_start, pa_end) = (360., 0.) if targets['Dec'][k] > 0. else (0., 360.)
+                rows.append((first + k, "{0:15} {0:11} {0:11} {1:13.5f} {2:13.5f} ".format('CVZ', pa_start, pa_end)))
+            rows.sort(key=lambda row: row[0])
+            for (k, line) in rows:
+                print("{:{}} {}{:13.5f} {:13.5f} ".format(names[k], width, line, ra[k], dec[k]), file=table_output)
+    finally:
+        if table_output is not None:
+            table_output.close()
 
 
 def plot_single_instrument(ax, instrument_name, t, min_pa, max_pa):
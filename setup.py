@@ -59,7 +59,7 @@ setup(
     # You can just specify the packages manually here if your project is
     # simple. Or you can use find_packages().
     packages=['jwst_gtvt'],
-    scripts=['bin/jwst_gtvt', 'bin/jwst_mtvt', 'bin/delete_cache'],
+    scripts=['bin/jwst_gtvt', 'bin/jwst_gtvt_batch', 'bin/jwst_mtvt', 'bin/delete_cache'],
 
     # List run-time dependencies here.  These will be installed by pip when
     # your project is installed. For an analysis of "install_requires" vs pip's
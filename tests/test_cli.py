@@ -0,0 +1,58 @@
+"""Command line parsing of the scripts in bin/."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# pyplot is imported on Agg first, so the scripts keep that backend instead of TkAgg
+RUN_HEADLESS = ("import sys, runpy, matplotlib; matplotlib.use('Agg'); import matplotlib.pyplot; "
+                "sys.argv = sys.argv[1:]; runpy.run_path(sys.argv[0], run_name='__main__')")
+
+
+def run_script(script, *args):
+    """Runs bin/script with args in a new process, without a display."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, '-c', RUN_HEADLESS, os.path.join(ROOT, 'bin', script)] + list(args),
+                          env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+@pytest.mark.parametrize('options', [['--no_verbose'], ['--v3pa', '250']])
+def test_negative_sexagesimal_dec(tmp_path, options):
+    table = os.path.join(str(tmp_path), 'table.txt')
+    plot = os.path.join(str(tmp_path), 'plot.png')
+    proc = run_script('jwst_gtvt', '16:52:58.9', '-02:24:03', '--start_date', '2021-01-01', '--end_date', '2021-12-31',
+                      '--save_table', table, '--save_plot', plot, *options)
+    assert proc.returncode == 0, proc.stderr
+    assert os.path.exists(plot)
+    if '--no_verbose' not in options:
+        with open(table) as fin:
+            text = fin.read()
+        assert '253.245  -2.401' in text
+        assert 'Specified V3 PA' in text
+
+
+def test_batch_catalog(tmp_path):
+    catalog = os.path.join(str(tmp_path), 'targets.txt')
+    table = os.path.join(str(tmp_path), 'windows.txt')
+    with open(catalog, 'w') as fout:
+        fout.write('16:52:58.9 -02:24:03 NGC 6240\n253.2458 2.4008\n')
+    proc = run_script('jwst_gtvt_batch', catalog, '--start_date', '2021-01-01', '--end_date', '2021-12-31',
+                      '--save_table', table)
+    assert proc.returncode == 0, proc.stderr
+    with open(table) as fin:
+        lines = fin.read().splitlines()
+    assert lines[0].split()[0] == 'Target'
+    assert any(line.startswith('NGC 6240') for line in lines)
+    assert any(line.startswith('2 ') for line in lines)
+
+
+def test_zero_step_rejected(tmp_path):
+    proc = run_script('jwst_gtvt', '16:52:58.9', '-02:24:03', '--step', '0', '--no_verbose',
+                      '--save_plot', os.path.join(str(tmp_path), 'plot.png'))
+    assert proc.returncode != 0
+    assert 'ValueError: Step should be a positive number of days' in proc.stderr
@@ -0,0 +1,121 @@
+"""Tests of loading, stitching and sample-free ephemerides."""
+
+import os
+
+import numpy as np
+import pytest
+
+from jwst_gtvt import ephemeris_old2x as EPH
+from jwst_gtvt import find_tgt_info as F
+
+
+def chebyshev_only(tmp_path):
+    """An Ephemeris built with from_chebyshev() from segments saved to tmp_path."""
+    path = os.path.join(str(tmp_path), 'segments.npy')
+    EPH.ChebyshevSegments.fit(EPH.get_ephemeris()).save(path)
+    return EPH.Ephemeris.from_chebyshev(path)
+
+
+def test_max_sun_rate_without_samples(tmp_path):
+    eph = chebyshev_only(tmp_path)
+    assert eph.datelist is None
+    rate = eph.max_sun_rate()
+    assert np.isfinite(rate)
+    assert abs(rate - EPH.get_ephemeris().max_sun_rate()) < 1e-3 * rate
+
+
+def test_adaptive_windows_without_samples(tmp_path):
+    eph = chebyshev_only(tmp_path)
+    ra = np.radians([0., 90., 253.245, 300.])
+    dec = np.radians([-30., 66., 2.401, 80.])
+    dates = eph.amin + np.arange(int(eph.amax - eph.amin) + 1.)
+    (tgt, start, end, cvz) = F.adaptive_windows_many(eph, dates[0], dates[-1], ra, dec)
+    (ref_tgt, ref_start, ref_end, ref_cvz) = F.scan_windows_many(eph, dates, ra, dec, None, EPH.BISECT_TOLERANCE)
+    assert np.array_equal(tgt, ref_tgt)
+    assert np.array_equal(cvz, ref_cvz)
+    assert np.abs(start - ref_start).max() < 1e-5
+    assert np.abs(end - ref_end).max() < 1e-5
+
+
+def test_ranged_load_skips_hashing_uncompiled_file(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    monkeypatch.setattr(EPH, 'ephemeris_cache_dir', lambda: str(cache_dir))
+    afile = str(tmp_path / os.path.basename(EPH.DEFAULT_EPHEMERIS))
+    with open(EPH.DEFAULT_EPHEMERIS, 'rb') as fin, open(afile, 'wb') as fout:
+        fout.write(fin.read())
+
+    ranged = EPH.Ephemeris(afile, verbose=False, start=59000., end=59030.)
+    assert not [key for key in EPH._checksum_cache if key[0] == os.path.abspath(afile)]
+    full = EPH.Ephemeris(afile, verbose=False)
+    assert os.listdir(str(cache_dir))
+    assert np.array_equal(ranged.samples, EPH.Ephemeris._slice_samples(full.samples, 59000., 59030.))
+
+
+def split_horizons(tmp_path, pieces):
+    """Writes Horizons files holding the records [first, last) of the bundled ephemeris, one per piece."""
+    with open(EPH.DEFAULT_EPHEMERIS) as fin:
+        lines = fin.read().splitlines(True)
+    soe = [line[:5] for line in lines].index('$$SOE') + 1
+    eoe = [line[:5] for line in lines].index('$$EOE')
+    paths = []
+    for (k, (first, last)) in enumerate(pieces):
+        path = os.path.join(str(tmp_path), 'horizons_EM_piece{}.txt'.format(k))
+        with open(path, 'w') as fout:
+            fout.writelines(lines[:soe] + lines[soe+first:soe+last] + lines[eoe:])
+        paths.append(path)
+    return paths
+
+
+def test_stitched_pieces_equal_original(tmp_path):
+    original = EPH.Ephemeris(EPH.DEFAULT_EPHEMERIS, verbose=False, cache=False)
+    count = len(original.samples)
+    paths = split_horizons(tmp_path, [(0, 800), (700, 1200), (1100, count)])
+    stitched = EPH.Ephemeris(paths, verbose=False, cache=False)
+    assert np.array_equal(stitched.samples, original.samples)
+    assert stitched.coverage == original.coverage
+
+    #A ranged load only reads the pieces overlapping the range.
+    (start, end) = (original.datelist[1150] + 0.5, original.datelist[1180])
+    ranged = EPH.Ephemeris([paths[0], paths[2]], verbose=False, cache=False, start=start, end=end)
+    assert np.array_equal(ranged.samples, EPH.Ephemeris._slice_samples(original.samples, start, end))
+    with pytest.raises(EPH.EphemerisRangeError):
+        EPH.Ephemeris(paths[:1], verbose=False, cache=False, start=original.datelist[900], end=original.datelist[950])
+
+
+def test_later_pieces_replace_earlier_ones_over_their_span():
+    samples = EPH.get_ephemeris().samples[:100]
+    coarse = np.array(samples[20:61:10])
+    coarse[:, 1:] *= 2.
+    merged = EPH.Ephemeris._stitch([samples, coarse])
+    assert np.array_equal(merged[:20], samples[:20])
+    assert np.array_equal(merged[20:25], coarse)
+    assert np.array_equal(merged[25:], samples[61:])
+    #Order matters: the earlier piece loses wherever the later one has samples.
+    merged = EPH.Ephemeris._stitch([coarse, samples])
+    assert np.array_equal(merged, samples)
+
+
+def test_sun_positions_read_from_cached_table():
+    eph = EPH.Ephemeris(EPH.DEFAULT_EPHEMERIS, verbose=False)
+    dates = eph.amin + np.arange(0., 30., 0.5)
+    expected = eph.sun_pos_many(dates[::3])
+    table = eph.sun_table(dates)
+    (ra, dec) = eph.sun_pos_many(dates[::3])
+    assert np.array_equal(ra, table.ra[::3]) and np.array_equal(dec, table.dec[::3])
+    assert np.allclose(ra, expected[0], rtol=0., atol=1e-12)
+    assert np.array_equal(eph.sun_unit_vectors(dates[1::3]), table.vectors[1::3])
+    assert eph._cached_sun(dates[:2] + 0.1) is None
+
+
+def test_sun_table_cache_bounded_in_bytes(monkeypatch):
+    eph = EPH.Ephemeris(EPH.DEFAULT_EPHEMERIS, verbose=False)
+    grids = [eph.amin + offset + np.arange(0., 100., 0.25) for offset in (0.1, 0.2, 0.3, 0.4)]
+    size = EPH.SunTable(eph, grids[0]).nbytes
+    monkeypatch.setattr(EPH, 'SUN_TABLE_CACHE_BYTES', 2*size + size//2)
+    tables = [eph.sun_table(dates) for dates in grids]
+    assert [table for (key, table) in eph._sun_tables] == tables[2:]
+    #A table larger than the limit is still kept while it is the most recent.
+    monkeypatch.setattr(EPH, 'SUN_TABLE_CACHE_BYTES', size//2)
+    table = eph.sun_table(grids[0])
+    assert [cached for (key, cached) in eph._sun_tables] == [table]
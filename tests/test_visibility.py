@@ -0,0 +1,157 @@
+"""Field of regard windows of compute_visibility() against a fine in_FOR_many() scan."""
+
+import numpy as np
+import pytest
+
+from jwst_gtvt import astro_funcx
+from jwst_gtvt import ephemeris_old2x as EPH
+from jwst_gtvt import find_tgt_info as F
+
+START_DATE = '2021-01-01'
+END_DATE = '2022-01-01'
+FINE_STEP = 0.01  # days between the dates of the reference scan
+EDGE_TOLERANCE = 2 * EPH.BISECT_TOLERANCE  # days, disagreement allowed around window edges
+TANGENT_LATITUDES = (45., 84.8)  # ecliptic latitudes (deg) where the Sun separation touches a limit
+TANGENT_OFFSETS = (-0.5, -0.2, -0.1, -0.05, 0., 0.05, 0.1, 0.2, 0.5)
+
+
+def ecliptic_to_equatorial(lon, lat):
+    """(ra, dec) in degrees of ecliptic (lon, lat) in radians."""
+    eps = astro_funcx.epsilon
+    (x, y, z) = (np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat))
+    (y, z) = (y*np.cos(eps) - z*np.sin(eps), y*np.sin(eps) + z*np.cos(eps))
+    return (np.degrees(np.arctan2(y, x)) % 360., np.degrees(np.arcsin(z)))
+
+
+def catalog():
+    """Targets at random positions followed by targets near a tangency of the Sun separation limits."""
+    rng = np.random.RandomState(19)
+    ra = np.degrees(rng.uniform(0., 2*np.pi, 100))
+    dec = np.degrees(np.arcsin(rng.uniform(-1., 1., 100)))
+    lat = np.radians([sign * (lat + offset) for lat in TANGENT_LATITUDES
+                      for offset in TANGENT_OFFSETS for sign in (1., -1.)])
+    (t_ra, t_dec) = ecliptic_to_equatorial(rng.uniform(0., 2*np.pi, len(lat)), lat)
+    return (np.concatenate((ra, t_ra)), np.concatenate((dec, t_dec)), len(ra))
+
+
+def test_tangent_targets_use_fallback():
+    (ra, dec, random) = catalog()
+    eph = EPH.get_ephemeris()
+    dates = F.visibility_dates(eph, START_DATE, END_DATE)
+    fallback = eph.sun_longitude_map().windows(np.radians(ra), np.radians(dec), dates[0], dates[-1])[4]
+    assert fallback[random:].sum() > (len(ra) - random) // 2
+
+
+@pytest.mark.parametrize('method', ['inversion', 'adaptive', 'scan'])
+def test_windows_match_fine_scan(method):
+    (ra, dec, random) = catalog()
+    eph = EPH.get_ephemeris()
+    (targets, windows) = F.compute_visibility(ra, dec, START_DATE, END_DATE, pa_ranges=False, method=method)
+    dates = targets.meta['dates']
+    fine = np.linspace(dates[0], dates[-1], int(round((dates[-1] - dates[0])/FINE_STEP)) + 1)
+    expected = eph.in_FOR_many(fine, np.radians(ra)[:, np.newaxis], np.radians(dec)[:, np.newaxis])
+
+    visible = np.zeros_like(expected)
+    near_edge = np.zeros_like(expected)  # within the accuracy of the window edges
+    visible[np.asarray(targets['CVZ'])] = True
+    for (k, start, end) in zip(windows['Target'], windows['Start'], windows['End']):
+        visible[k] |= (fine >= start) & (fine <= end)
+        near_edge[k] |= (np.abs(fine - start) <= EDGE_TOLERANCE) | (np.abs(fine - end) <= EDGE_TOLERANCE)
+    assert not np.any((visible != expected) & ~near_edge)
+
+
+@pytest.mark.parametrize('step', [0., -1.])
+def test_step_must_be_positive(step):
+    with pytest.raises(ValueError):
+        F.compute_target(10., 20., START_DATE, END_DATE, step=step)
+    with pytest.raises(ValueError):
+        F.compute_visibility([10.], [20.], START_DATE, END_DATE, step=step)
+
+
+def test_pa_table_on_search_grid():
+    eph = EPH.Ephemeris(EPH.DEFAULT_EPHEMERIS, verbose=False)
+    result = F.compute_target(10., 20., START_DATE, END_DATE, step=0.25, A_eph=eph)
+    assert np.array_equal(result.days, result.dates[:-1])
+    assert [len(table) for (key, table) in eph._sun_tables] == [len(result.dates)]
+
+
+def test_adaptive_steps_evaluate_less_than_daily_grid(monkeypatch):
+    (ra, dec, random) = catalog()
+    eph = EPH.get_ephemeris()
+    dates = F.visibility_dates(eph, START_DATE, END_DATE)
+    evaluations = []
+    dist_many = astro_funcx.dist_many
+    def counting_dist_many(*args):
+        separation = dist_many(*args)
+        evaluations.append(separation.size)
+        return separation
+    monkeypatch.setattr(astro_funcx, 'dist_many', counting_dist_many)
+    eph.step_FOR_many(dates[0], dates[-1], np.radians(ra), np.radians(dec))
+    assert sum(evaluations) < len(ra) * len(dates) / 2
+
+
+def test_adaptive_finds_sub_day_graze():
+    #Leaves the field of regard for ~0.77 day between two dates of the daily grid.
+    (ra, dec) = ecliptic_to_equatorial(np.array([0.75*np.pi]), np.radians([45.04]))
+    eph = EPH.get_ephemeris()
+    dates = F.visibility_dates(eph, START_DATE, END_DATE)
+    (fine, state) = fine_scan(ra, dec, dates)
+    edges = fine[1:][np.diff(state[0].astype(int)) != 0]
+    assert np.diff(edges).min() < 1.
+
+    (tgt, start, end, cvz) = F.adaptive_windows_many(eph, dates[0], dates[-1], np.radians(ra), np.radians(dec))
+    found = np.concatenate((start, end))
+    found = np.sort(found[(found > dates[0]) & (found < dates[-1])])
+    assert len(found) == len(edges)
+    assert np.abs(found - edges).max() <= FINE_STEP
+    assert len(F.scan_windows_many(eph, dates, np.radians(ra), np.radians(dec), None, EPH.BISECT_TOLERANCE)[0]) < len(tgt)
+
+
+def fine_scan(ra, dec, dates):
+    """Dates every FINE_STEP days over dates and the in_FOR_many() state of every target on them."""
+    fine = np.linspace(dates[0], dates[-1], int(round((dates[-1] - dates[0])/FINE_STEP)) + 1)
+    return (fine, EPH.get_ephemeris().in_FOR_many(fine, np.radians(ra)[:, np.newaxis], np.radians(dec)[:, np.newaxis]))
+
+
+def transitions(fine, state, start, end, entering):
+    """Targets entering (or leaving) between start and end on the fine scan.
+
+    Returns (certain, possible): those whose transition falls between two
+    fine dates inside [start, end), and those whose transition is only
+    known to fall in a fine step overlapping start or end."""
+    flips = (~state[:, :-1] & state[:, 1:]) if entering else (state[:, :-1] & ~state[:, 1:])
+    (target, j) = np.nonzero(flips)
+    (before, after) = (fine[j], fine[j+1])
+    certain = (before >= start) & (after < end)
+    possible = (after > start) & (before < end)
+    return (sorted(target[certain]), sorted(target[possible]))
+
+
+def test_sweep_matches_fine_scan():
+    (ra, dec, random) = catalog()
+    sweep = F.VisibilitySweep.from_catalog(ra, dec, START_DATE, END_DATE)
+    (fine, state) = fine_scan(ra, dec, sweep.dates)
+    (windows_start, windows_end) = (sweep.times[0::2], sweep.times[1::2])
+    near_edge = np.zeros(len(fine), dtype=bool)
+    for edge in np.concatenate((windows_start, windows_end)):
+        near_edge |= np.abs(fine - edge) <= EDGE_TOLERANCE
+
+    #Windows open at the start are counted without an entry.
+    assert len(sweep.open) > 0
+    counts = sweep.counts(fine)
+    assert np.array_equal(counts[~near_edge], state.sum(axis=0)[~near_edge])
+    assert np.array_equal(sweep.counts(), EPH.get_ephemeris().in_FOR_many(
+        sweep.dates, np.radians(ra)[:, np.newaxis], np.radians(dec)[:, np.newaxis]).sum(axis=0))
+    assert not np.any(sweep.counts([sweep.start - 1., sweep.end + 1.]))
+
+    #Query ranges overlapping the start and the end of the interval, and inside it.
+    ranges = [(sweep.start - 30., sweep.start + 20.), (sweep.end - 20., sweep.end + 30.)]
+    ranges += [(date, date + 7.) for date in sweep.start + np.arange(30.25, 330., 30.)]
+    for (start, end) in ranges:
+        for (found, entering) in ((sweep.entering(start, end), True), (sweep.exiting(start, end), False)):
+            (certain, possible) = transitions(fine, state, start, end, entering)
+            targets = sorted(target for (date, target) in found)
+            assert all(start <= date < end for (date, target) in found)
+            assert [date for (date, target) in found] == sorted(date for (date, target) in found)
+            assert set(certain) <= set(targets) <= set(possible)
+            assert len(certain) <= len(targets) <= len(possible)